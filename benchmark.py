@@ -0,0 +1,297 @@
+"""
+Benchmarks of the test system, run 'python benchmark.py <name> --help' to see options
+
+fork_server - tests per second with fresh interpreter per test and with fork server
+judge - attempts and tests per second of Checker.check_attempt on a throwaway database with synthetic tasks
+trials - time to save results of one attempt on a task with many tests, trial by trial and in one transaction
+queries - number of SQL queries of the contest views, fails if it grows with the number of tasks
+"""
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import resource
+from os import path, cpu_count, environ
+from time import perf_counter, time
+from concurrent.futures import ThreadPoolExecutor
+from fork_server import ForkServer
+from comparator import Collector
+
+SOLUTION = 'a, b = map(int, input().split())\nprint(a + b)\n'
+HEAVY_SOLUTION = 'n = int(input())\nprint(\'\\n\'.join(map(str, range(n))))\n'
+SOLUTIONS = {  # kind: (task, solution)
+    'ok': ('sum', SOLUTION),
+    'wa': ('sum', 'a, b = map(int, input().split())\nprint(a - b)\n'),
+    're': ('sum', 'a, b = map(int, input().split())\nprint(a // 0)\n'),
+    'tl': ('sum', 'while True:\n    pass\n'),
+    'ce': ('sum', 'print(\n'),
+    'output': ('heavy', HEAVY_SOLUTION),
+}
+
+
+def measure(run, tests: int, threads: int) -> float:
+    """Return tests per second for run(index) -> (returncode, stdout) called tests times in threads"""
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(run, range(tests)))
+    elapsed = perf_counter() - start
+    assert all(result == (0, f'{ind + 1}\n') for ind, result in enumerate(results)), 'wrong output'
+    return tests / elapsed
+
+
+def run_fork_server(server: ForkServer, file: str, inp: str) -> (int, str):
+    collector = Collector(1024)
+    result = server.run(file, inp, 10, collector)
+    return result.returncode, collector.get_output(server.encoding)
+
+
+def fork_server(args):
+    with tempfile.TemporaryDirectory() as directory:
+        file = path.join(directory, 'solution.py')
+        with open(file, 'w', encoding='UTF-8') as solution:
+            solution.write(SOLUTION)
+        server = ForkServer(args.python, args.threads)
+        report = {'tests': args.tests,
+                  'threads': args.threads,
+                  'subprocess': measure(lambda ind: (lambda result: (result.returncode, result.stdout))(subprocess.run([args.python, file], input=f'{ind} 1', text=True, capture_output=True, timeout=10)), args.tests, args.threads),
+                  'fork_server': measure(lambda ind: run_fork_server(server, file, f'{ind} 1'), args.tests, args.threads)}
+        server.close()
+    report['speedup'] = report['fork_server'] / report['subprocess']
+    print(json.dumps(report, indent=4))
+
+
+def percentile(values: list, percent: float) -> float:
+    """Nearest-rank percentile of values, 0.0 for empty list"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))]
+
+
+def commit():
+    """Return current git commit of the repository or None"""
+    result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=path.dirname(path.abspath(__file__)), capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def judge(args):
+    environ['JUDGE_FORK_SERVER'] = str(args.fork_server)
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    assert kinds and all(kind in SOLUTIONS for kind in kinds), f'kinds should be some of {", ".join(SOLUTIONS)}'
+    with tempfile.TemporaryDirectory() as directory:
+        models = prepare_database(directory, args.python)
+        from db_session import create_session, remove_session
+        from test_system import Checker
+        session = create_session()
+        user = models.User(username='benchmark', email='benchmark', password='', name='', surname='', register_date=int(time()), registered=True, creator=True)
+        session.add(user)
+        session.commit()
+        tasks = {'sum': models.Task.add_task(user.id, args.time_limit, 'sum', 'a + b', SOLUTION, [{'input': f'{ind} {ind * 7}'} for ind in range(args.tests)]),
+                 'heavy': models.Task.add_task(user.id, args.time_limit, 'heavy', 'many lines', HEAVY_SOLUTION, [{'input': str(args.output_lines + ind)} for ind in range(args.tests)])}
+        assert all(task['status'] == 'ok' for task in tasks.values()), f'tasks were not created: {tasks}'
+        attempts = []
+        for ind in range(args.attempts):
+            kind = kinds[ind % len(kinds)]
+            task, solution = SOLUTIONS[kind]
+            attempt = models.Attempt(contest_id=0, task_id=tasks[task]['id'], user_id=user.id, solution=f'{solution}# {ind}\n', status='?', time=int(time()))  # unique, not taken from verdict cache
+            session.add(attempt)
+            session.commit()
+            attempts.append((attempt.id, kind))
+
+        def check(attempt_id: int) -> float:
+            try:
+                Checker.check_attempt(attempt_id)
+            finally:
+                remove_session()  # like a judge job
+            return perf_counter()
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='judge') as pool:
+            latencies = [finish - start for finish in pool.map(check, [attempt_id for attempt_id, kind in attempts])]
+        elapsed = perf_counter() - start
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        judge_cpu = usage_after.ru_utime - usage.ru_utime + usage_after.ru_stime - usage.ru_stime
+        remove_session()  # attempts were loaded before the check
+        statuses, tests, solutions_cpu = {}, 0, 0.0
+        for attempt_id, kind in attempts:
+            attempt = models.Attempt.get_attempt(attempt_id)
+            statuses.setdefault(kind, {})
+            statuses[kind][attempt.status] = statuses[kind].get(attempt.status, 0) + 1
+            for trial in attempt.get_tests_statuses():
+                if trial.status != 'TS':
+                    tests += 1
+                    solutions_cpu += trial.cpu_time or 0.0
+    report = {'commit': commit(),
+              'python': args.python,
+              'fork_server': Checker.fork_server is not None,
+              'workers': args.workers,
+              'attempts': args.attempts,
+              'tests_per_task': args.tests,
+              'time_limit': args.time_limit,
+              'kinds': kinds,
+              'statuses': statuses,
+              'elapsed': elapsed,
+              'attempts_per_second': len(attempts) / elapsed,
+              'tests_per_second': tests / elapsed,
+              'latency': {'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99)},
+              'judge_cpu': judge_cpu,
+              'solutions_cpu': solutions_cpu,
+              'judge_cpu_per_attempt': judge_cpu / len(attempts) if attempts else 0.0,
+              'judge_cpu_overhead': judge_cpu / (judge_cpu + solutions_cpu) if judge_cpu + solutions_cpu else 0.0}
+    print(json.dumps(report, indent=4))
+
+
+def prepare_database(directory: str, python: str):
+    """Create throwaway database in directory, return models module"""
+    environ['PYTHON_INTERPRETER'] = python
+    environ['TEST_STORAGE'] = path.join(directory, 'tests')
+    for key in ('HOST_FULLNAME', 'MAIL_LOGIN_GOOGLE', 'SALT'):
+        environ.setdefault(key, 'benchmark')
+    import db_session
+    db_session.global_init(path.join(directory, 'benchmark.db'))
+    import models
+    models.__init__()
+    return models
+
+
+def trials(args):
+    with tempfile.TemporaryDirectory() as directory:
+        models = prepare_database(directory, sys.executable)
+        from db_session import create_session
+        session = create_session()
+        user = models.User(username='benchmark', email='benchmark', password='', name='', surname='', register_date=int(time()), registered=True, creator=True)
+        session.add(user)
+        session.commit()
+        task = models.Task(creator=user.id, time_limit=1.0, title='trials', description='', reference=SOLUTION, attempts=0, successful=0)
+        session.add(task)
+        session.commit()
+        tests = [models.Test(task_id=task.id, input=f'{ind} 1', output=f'{ind + 1}\n', points=1) for ind in range(args.tests)]
+        session.add_all(tests)
+        session.commit()
+        results = [{'test_id': test.id, 'status': 'OK' if ind < args.tests // 2 else 'TS', 'output': None, 'time': 0.01, 'cpu_time': 0.01, 'memory': 10000} for ind, test in enumerate(tests)]
+
+        def new_attempt(ind: int):
+            attempt = models.Attempt(contest_id=0, task_id=task.id, user_id=user.id, solution=f'# {ind}', status='?', time=int(time()))
+            session.add(attempt)
+            session.commit()
+            return models.Attempt.get_attempt(attempt.id)
+
+        def trial_by_trial(attempt):
+            for result in results:
+                models.Trial.add_trial(attempt_id=attempt.id, **result)
+            attempt.change_data(status='WA', score=args.tests // 2)
+            models.Task.get_task(task.id).add_attempt(False)
+
+        def one_transaction(attempt):
+            attempt.save_result('WA', args.tests // 2, results)
+
+        report = {'tests': args.tests, 'attempts': args.attempts}
+        for name, save in (('trial_by_trial', trial_by_trial), ('one_transaction', one_transaction)):
+            attempts = [new_attempt(ind) for ind in range(args.attempts)]
+            start = perf_counter()
+            for attempt in attempts:
+                save(attempt)
+            report[name] = (perf_counter() - start) / args.attempts  # seconds per attempt
+        assert models.Task.get_task(task.id).attempts == 2 * args.attempts, 'wrong attempts counter'
+    report['speedup'] = report['trial_by_trial'] / report['one_transaction']
+    print(json.dumps(report, indent=4))
+
+
+def count_queries(engine, run) -> int:
+    """Return number of SQL statements executed by run()"""
+    from sqlalchemy import event
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        run()
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return len(statements)
+
+
+def queries(args):
+    with tempfile.TemporaryDirectory() as directory:
+        models = prepare_database(directory, sys.executable)
+        from flask import Flask
+        from db_session import create_session, remove_session
+        import resources
+        app = Flask(__name__)
+        session = create_session()
+        user = models.User(username='benchmark', email='benchmark', password='', name='', surname='', register_date=int(time()), registered=True, creator=True, api_key='benchmark')
+        session.add(user)
+        session.commit()
+        user_id = user.id
+        report = {}
+        for count in sorted(set(args.tasks)):
+            session = create_session()
+            tasks = [models.Task(creator=user_id, time_limit=1.0, title=f'{count} {ind}', description='', reference=SOLUTION, attempts=0, successful=0) for ind in range(count)]
+            session.add_all(tasks)
+            session.commit()
+            contest = models.Contest(title=str(count), description='', start_time=int(time()) + 3600, end_time=int(time()) + 7200)
+            session.add(contest)
+            session.flush()
+            session.add(models.ContestCreator(contest_id=contest.id, user_id=user_id))
+            session.add_all([models.ContestTask(contest_id=contest.id, position=position, task_id=task.id) for position, task in enumerate(tasks)])
+            session.commit()
+            session.add_all([models.Attempt(contest_id=contest.id, task_id=task.id, user_id=user_id, solution=f'# {task.id} {ind}', status='OK', score=ind, time=int(time())) for task in tasks for ind in range(args.attempts)])
+            session.commit()
+            contest = models.Contest.get_contest(contest.id)
+            task_id = tasks[0].id
+            engine = create_session().get_bind()
+
+            def request(resource, *ids, show_solution=False):
+                with app.test_request_context('/', json={'api_key': 'benchmark', 'show_solution': show_solution}):
+                    resource().get(*ids)
+                remove_session()  # as at the end of a request in main.py
+
+            report[count] = {'get_view': count_queries(engine, lambda: contest.get_view(user_id)),
+                             'ContestResource': count_queries(engine, lambda: request(resources.ContestResource, contest.id)),
+                             'ContestTaskResource': count_queries(engine, lambda: request(resources.ContestTaskResource, contest.id, task_id)),
+                             'ContestResource show_solution': count_queries(engine, lambda: request(resources.ContestResource, contest.id, show_solution=True)),
+                             'ContestTaskResource show_solution': count_queries(engine, lambda: request(resources.ContestTaskResource, contest.id, task_id, show_solution=True))}
+    print(json.dumps(report, indent=4))
+    counts = list(report.values())
+    assert all(queries == counts[0] for queries in counts), 'number of queries grows with the number of tasks'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the test system')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('fork_server', help='tests per second with and without fork server')
+    command.add_argument('--python', default=sys.executable, help='interpreter that runs solutions')
+    command.add_argument('--tests', type=int, default=200, help='how many tests to run')
+    command.add_argument('--threads', type=int, default=cpu_count() or 1, help='how many tests to run at the same time')
+    command.set_defaults(run=fork_server)
+    command = commands.add_parser('judge', help='attempts per second, verdict latency and judge CPU overhead')
+    command.add_argument('--python', default=sys.executable, help='interpreter that runs solutions')
+    command.add_argument('--attempts', type=int, default=60, help='how many attempts to check')
+    command.add_argument('--tests', type=int, default=10, help='tests in every task')
+    command.add_argument('--time-limit', type=float, default=1.0, help='time limit of the tasks')
+    command.add_argument('--output-lines', type=int, default=100000, help='lines printed by output-heavy solution')
+    command.add_argument('--kinds', default=','.join(SOLUTIONS), help='comma separated kinds of solutions submitted in turn: ' + ', '.join(SOLUTIONS))
+    command.add_argument('--workers', type=int, default=int(environ.get('JUDGE_WORKERS', 2)), help='attempts checked at the same time')
+    command.add_argument('--no-fork-server', dest='fork_server', action='store_false', help='run every test in a fresh interpreter')
+    command.set_defaults(run=judge)
+    command = commands.add_parser('trials', help='seconds to save results of one attempt trial by trial and in one transaction')
+    command.add_argument('--tests', type=int, default=100, help='tests in the task')
+    command.add_argument('--attempts', type=int, default=10, help='how many attempts to save')
+    command.set_defaults(run=trials)
+    command = commands.add_parser('queries', help='SQL queries of the contest views with different number of tasks')
+    command.add_argument('--tasks', type=lambda value: [int(count) for count in value.split(',')], default=[1, 20], help='comma separated numbers of tasks in the contest')
+    command.add_argument('--attempts', type=int, default=3, help='attempts of the user on every task')
+    command.set_defaults(run=queries)
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
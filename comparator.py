@@ -0,0 +1,82 @@
+class Collector:
+    """Keeps the whole output of the process, stops the process when output is longer than limit bytes"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.reset()
+
+    def reset(self):
+        """Forget output taken so far, the process is run again"""
+        self.chunks = []
+        self.size = 0
+        self.stopped = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """Take next chunk of output, return False if process should be stopped"""
+        self.size += len(chunk)
+        if self.size > self.limit:
+            self.stopped = True
+            return False
+        self.chunks.append(chunk)
+        return True
+
+    def finish(self):
+        """Called when output is closed"""
+
+    def get_output(self, encoding: str) -> str:
+        return _decode(b''.join(self.chunks), encoding)
+
+
+class Comparator:
+    """
+    Compares output of the process with expected one chunk by chunk without keeping it,
+    stops the process on the first difference, only first report_limit bytes are kept for the report
+    """
+
+    def __init__(self, expected, encoding: str, report_limit: int):
+        self.expected = expected.encode(encoding, errors='replace') if isinstance(expected, str) else expected  # str or encoded bytes/mmap
+        self.report_limit = report_limit
+        self.reset()
+
+    def reset(self):
+        """Forget output compared so far, the process is run again"""
+        self.prefix = bytearray()
+        self.position = 0  # bytes compared
+        self.mismatch = None  # position of the first difference
+        self.stopped = False
+        self.carry = b''  # '\r' at the end of previous chunk, it can be a part of '\r\n'
+
+    def feed(self, chunk: bytes) -> bool:
+        """Take next chunk of output, return False if process should be stopped"""
+        chunk, self.carry = self.carry + chunk, b''
+        if chunk.endswith(b'\r'):
+            chunk, self.carry = chunk[:-1], b'\r'
+        chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')  # same as universal newlines
+        if len(self.prefix) < self.report_limit:
+            self.prefix += chunk[:self.report_limit - len(self.prefix)]
+        expected = self.expected[self.position:self.position + len(chunk)]
+        if expected != chunk:
+            self.mismatch = self.position + next((ind for ind, (a, b) in enumerate(zip(expected, chunk)) if a != b), min(len(expected), len(chunk)))
+            self.stopped = True
+            return False
+        self.position += len(chunk)
+        return True
+
+    def finish(self):
+        """Called when output is closed, output shorter than expected is a difference too"""
+        if self.carry and not self.stopped:
+            self.carry = b''
+            self.feed(b'\n')
+        if self.mismatch is None and self.position != len(self.expected):
+            self.mismatch = self.position
+
+    def matched(self) -> bool:
+        return self.mismatch is None
+
+    def get_report(self, encoding: str) -> str:
+        """Return first report_limit bytes of the output"""
+        return _decode(bytes(self.prefix), encoding)
+
+
+def _decode(data: bytes, encoding: str) -> str:
+    return data.decode(encoding, errors='replace').replace('\r\n', '\n').replace('\r', '\n')
@@ -1,3 +1,6 @@
+from os import environ
+from time import time
+from zlib import compress
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session
@@ -5,6 +8,11 @@ import sqlalchemy.ext.declarative as dec
 
 SqlAlchemyBase = dec.declarative_base()
 
+migrations = sa.Table('migrations', SqlAlchemyBase.metadata,  # data migrations that were run on the database
+                      sa.Column('version', sa.Integer, primary_key=True),
+                      sa.Column('name', sa.String, nullable=False),
+                      sa.Column('applied_time', sa.Integer, nullable=False))
+
 __factory = None
 
 
@@ -17,17 +25,167 @@ def global_init(db_file):
     if not db_file or not db_file.strip():
         raise Exception("Необходимо указать файл базы данных.")
 
-    conn_str = f'sqlite:///{db_file.strip()}?check_same_thread=False'
+    conn_str = db_file.strip() if '://' in db_file else f'sqlite:///{db_file.strip()}?check_same_thread=False'
     print(f"Подключение к базе данных по адресу {conn_str}")
 
-    engine = sa.create_engine(conn_str, echo=False)
-    __factory = orm.sessionmaker(bind=engine)
+    engine = sa.create_engine(conn_str, echo=False, poolclass=sa.pool.QueuePool,
+                              pool_size=int(environ.get('DATABASE_POOL_SIZE', 5)),  # connections kept open
+                              max_overflow=int(environ.get('DATABASE_MAX_OVERFLOW', 10)),  # connections opened above pool_size under load
+                              pool_timeout=float(environ.get('DATABASE_POOL_TIMEOUT', 30)),  # seconds to wait for a free connection
+                              pool_pre_ping='://' in db_file)  # server can close idle connections, SQLite file can't
+    __factory = orm.scoped_session(orm.sessionmaker(bind=engine))
 
     import models
 
     SqlAlchemyBase.metadata.create_all(engine)
+    __add_columns(engine)
+    __migrate(engine)
+    __add_indexes(engine)
+
+
+def __add_columns(engine):
+    """Add nullable columns that appeared in models after the table was created"""
+    inspector = sa.inspect(engine)
+    with engine.begin() as connection:
+        for table in SqlAlchemyBase.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    print(f"Добавление столбца {table.name}.{column.name}")
+                    connection.execute(sa.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'))
+                    for index in table.indexes:
+                        if column.name in index.columns:
+                            index.create(connection)
+
+
+def __add_indexes(engine):
+    """Create indexes that appeared in models after the table was created"""
+    inspector = sa.inspect(engine)
+    with engine.begin() as connection:
+        for table in SqlAlchemyBase.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    print(f"Создание индекса {index.name}")
+                    index.create(connection)
+
+
+def __migrate(engine):
+    """
+    Run data migrations that were not run on the database yet, in order, each once,
+    version of a migration is its place in the list, so new ones are only appended to the end
+    """
+    steps = [__move_tests, __move_solutions, __pack_outputs, __link_contests]
+    with engine.begin() as connection:
+        applied = {version for version, in connection.execute(sa.select(migrations.c.version))}
+    for version, step in enumerate(steps, 1):
+        if version in applied:
+            continue
+        step(engine)
+        with engine.begin() as connection:
+            connection.execute(migrations.insert().values(version=version, name=step.__name__.strip('_'), applied_time=int(time())))
+
+
+def __drop_columns(engine, name: str, columns: list):
+    """Drop columns that are not in models anymore, old SQLite can't drop columns, so the table is copied keeping references of other tables to it"""
+    table = SqlAlchemyBase.metadata.tables[name]
+    with engine.begin() as connection:
+        if engine.dialect.name != 'sqlite':
+            for column in columns:
+                connection.execute(sa.text(f'ALTER TABLE {name} DROP COLUMN {column}'))
+            return
+        connection.execute(sa.text('PRAGMA legacy_alter_table = ON'))
+        for index in table.indexes:
+            connection.execute(sa.text(f'DROP INDEX IF EXISTS {index.name}'))
+        connection.execute(sa.text(f'ALTER TABLE {name} RENAME TO {name}_old'))
+        table.create(connection)
+        kept = ', '.join(column.name for column in table.columns)
+        connection.execute(sa.text(f'INSERT INTO {name} ({kept}) SELECT {kept} FROM {name}_old'))
+        connection.execute(sa.text(f'DROP TABLE {name}_old'))
+
+
+def __move_tests(engine):
+    """Move input and output of tests kept in the database before Storage into it, then drop these columns"""
+    from storage import Storage
+    if 'input' not in {column['name'] for column in sa.inspect(engine).get_columns('tests')}:
+        return
+    with engine.begin() as connection:
+        rows = connection.execute(sa.text('SELECT id, input, output FROM tests WHERE input_hash IS NULL')).fetchall()
+        print(f"Перенос {len(rows)} тестов в {Storage.root}")
+        for test_id, inp, output in rows:
+            connection.execute(sa.text('UPDATE tests SET input_hash = :input_hash, output_hash = :output_hash WHERE id = :id'),
+                               {'id': test_id, 'input_hash': Storage.put(inp), 'output_hash': Storage.put(output)})
+    __drop_columns(engine, 'tests', ['input', 'output'])
+
+
+def __move_solutions(engine):
+    """Move solutions of attempts kept in the attempts table into sources, same solutions are kept once, then drop the column"""
+    from models import Source
+    if 'solution' not in {column['name'] for column in sa.inspect(engine).get_columns('attempts')}:
+        return
+    with engine.begin() as connection:
+        rows = connection.execute(sa.text('SELECT id, solution FROM attempts WHERE solution_hash IS NULL')).fetchall()
+        print(f"Перенос {len(rows)} решений в таблицу sources")
+        saved = set(key for key, in connection.execute(sa.text('SELECT hash FROM sources')))
+        sources, hashes = [], []
+        for attempt_id, solution in rows:
+            key = Source.hash_source(solution)
+            if key not in saved:
+                saved.add(key)
+                sources.append({'hash': key, 'data': compress(solution.encode('UTF-8'))})
+            hashes.append({'id': attempt_id, 'hash': key})
+        if sources:
+            connection.execute(sa.text('INSERT INTO sources (hash, data) VALUES (:hash, :data)'), sources)
+        if hashes:
+            connection.execute(sa.text('UPDATE attempts SET solution_hash = :hash WHERE id = :id'), hashes)
+    __drop_columns(engine, 'attempts', ['solution'])
+
+
+def __pack_outputs(engine):
+    """Compress wrong answers kept as text in the trial table, only the beginning shown in reports is kept, then drop the column"""
+    from models import Trial
+    from test_system import Checker
+    if 'output' not in {column['name'] for column in sa.inspect(engine).get_columns('trial')}:
+        return
+    with engine.begin() as connection:
+        rows = connection.execute(sa.text('SELECT id, output FROM trial WHERE output IS NOT NULL AND output_data IS NULL')).fetchall()
+        print(f"Сжатие {len(rows)} неверных ответов")
+        if rows:
+            connection.execute(sa.text('UPDATE trial SET output_data = :data WHERE id = :id'),
+                               [{'id': trial_id, 'data': Trial.pack(output.encode('UTF-8')[:Checker.report_limit].decode('UTF-8', errors='ignore'))} for trial_id, output in rows])
+    __drop_columns(engine, 'trial', ['output'])
+
+
+def __link_contests(engine):
+    """Move comma-joined creators and tasks of contests into contest_creators and contest_tasks, then drop these columns"""
+    if 'tasks' not in {column['name'] for column in sa.inspect(engine).get_columns('contests')}:
+        return
+    with engine.begin() as connection:
+        rows = connection.execute(sa.text('SELECT id, creators, tasks FROM contests')).fetchall()
+        print(f"Перенос задач и авторов {len(rows)} турниров")
+        creators, tasks = [], []
+        for contest_id, contest_creators, contest_tasks in rows:
+            user_ids = [int(user_id) for user_id in (contest_creators or '').split(',') if user_id.strip().isdigit()]
+            creators.extend({'contest_id': contest_id, 'user_id': user_id} for user_id in dict.fromkeys(user_ids))
+            task_ids = [int(task_id) for task_id in (contest_tasks or '').split(',') if task_id.strip().isdigit()]
+            tasks.extend({'contest_id': contest_id, 'position': position, 'task_id': task_id} for position, task_id in enumerate(task_ids))
+        connection.execute(sa.text('DELETE FROM contest_creators'))
+        connection.execute(sa.text('DELETE FROM contest_tasks'))
+        if creators:
+            connection.execute(sa.text('INSERT INTO contest_creators (contest_id, user_id) VALUES (:contest_id, :user_id)'), creators)
+        if tasks:
+            connection.execute(sa.text('INSERT INTO contest_tasks (contest_id, position, task_id) VALUES (:contest_id, :position, :task_id)'), tasks)
+    __drop_columns(engine, 'contests', ['creators', 'tasks'])
 
 
 def create_session() -> Session:
+    """Return session of the current thread, it is the same until remove_session() is called"""
     global __factory
     return __factory()
+
+
+def remove_session():
+    """Close session of the current thread and give its connection back to the pool, called at the end of request or judge job"""
+    global __factory
+    if __factory:
+        __factory.remove()
@@ -0,0 +1,421 @@
+"""
+Warm python interpreters for the test system.
+
+Every worker is started once with 'python fork_server.py <fd>' and waits for requests on a unix socket.
+For every run it forks, the child redirects stdin/stdout/stderr to descriptors received with the request
+and executes the solution, so a test pays only for the fork instead of the whole interpreter startup.
+This file is also executed by PYTHON_INTERPRETER, so the worker part uses only the standard library.
+"""
+import os
+import sys
+import json
+import array
+import signal
+import socket
+import selectors
+import subprocess
+import threading
+import traceback
+import builtins
+import resource
+import marshal
+import py_compile
+from locale import getpreferredencoding
+from queue import Queue, Empty
+from time import perf_counter
+
+MAX_MESSAGE = 65536
+MAX_FDS = 3
+CHUNK = 65536
+STDERR_LIMIT = 65536
+
+
+def _send(sock: socket.socket, data: dict, fds=()):
+    message = json.dumps(data).encode('UTF-8')
+    ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))] if fds else []
+    sock.sendmsg([message], ancillary)
+
+
+def _recv(sock: socket.socket) -> (dict, list):
+    fds = array.array('i')
+    message, ancillary, flags, address = sock.recvmsg(MAX_MESSAGE, socket.CMSG_SPACE(MAX_FDS * fds.itemsize))
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    return (json.loads(message.decode('UTF-8')) if message else None), list(fds)
+
+
+def _load(file: str):
+    """Return code object of the solution file, .pyc files are loaded without compilation"""
+    with open(file, 'rb') as source:
+        if file.endswith('.pyc'):
+            return marshal.loads(source.read()[16:])
+        return compile(source.read(), file, 'exec')
+
+
+def _compile(request: dict) -> dict:
+    """Byte-compile request['file'] into request['target'], return {'error': None or str}"""
+    try:
+        py_compile.compile(request['file'], cfile=request['target'], doraise=True)
+        return {'error': None}
+    except py_compile.PyCompileError as ex:
+        return {'error': ex.msg}
+
+
+def _execute(code, file: str):
+    """Execute solution in the forked child and exit with the same code python would"""
+    status = 0
+    try:
+        exec(code, {'__name__': '__main__', '__file__': file, '__builtins__': builtins})
+    except SystemExit as ex:
+        if ex.code is None:
+            status = 0
+        elif isinstance(ex.code, int):
+            status = ex.code
+        else:
+            print(ex.code, file=sys.stderr)
+            status = 1
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except Exception:
+        status = status or 120
+    os._exit(status & 0xff)
+
+
+def _limit_memory(limit: int):
+    """Allow the process to allocate limit bytes more than it already uses"""
+    try:
+        with open('/proc/self/statm') as statm:
+            used = int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        used = 0
+    resource.setrlimit(resource.RLIMIT_AS, (used + limit, used + limit))
+
+
+def _returncode(status: int) -> int:
+    return -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+
+def _memory(usage) -> int:
+    """Return peak memory in KB"""
+    return usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+
+
+def _start(request: dict, ready: int):
+    """Load the solution and limit its memory in the forked child, tell the parent memory used before the solution, return code object"""
+    code = _load(request['file'])
+    if request.get('memory_limit'):
+        _limit_memory(request['memory_limit'])
+    sys.argv = [code.co_filename]
+    sys.path[0] = os.path.dirname(os.path.abspath(code.co_filename))
+    os.write(ready, str(_memory(resource.getrusage(resource.RUSAGE_SELF))).encode())
+    os.close(ready)
+    return code
+
+
+def _started(ready: int):
+    """Return memory in KB the child used before the solution (not counted for it) or None if it failed to start the solution"""
+    started = os.read(ready, 64)
+    os.close(ready)
+    return int(started) if started else None
+
+
+def _child(request: dict, fds: list, ready: int):
+    try:
+        os.setsid()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        os.closerange(3, ready)
+        os.closerange(ready + 1, os.sysconf('SC_OPEN_MAX'))
+        code = _start(request, ready)
+    except BaseException:
+        traceback.print_exc()
+        sys.stderr.flush()
+        os._exit(1)
+    _execute(code, code.co_filename)
+
+
+def _run(sock: socket.socket, request: dict, fds: list) -> dict:
+    """Fork, send pid of the child, wait until it starts solution code and measure time from that moment"""
+    ready_r, ready_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_r)
+        _child(request, fds, ready_w)
+    os.close(ready_w)
+    for fd in fds:
+        os.close(fd)
+    _send(sock, {'pid': pid})
+    baseline = _started(ready_r)
+    timeout = [False]
+
+    def kill(signum, frame):
+        timeout[0] = True
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    start = perf_counter()
+    if baseline is not None:
+        signal.signal(signal.SIGALRM, kill)
+        signal.setitimer(signal.ITIMER_REAL, request['time_limit'])
+    _, status, usage = os.wait4(pid, 0)
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    wall = perf_counter() - start
+    try:
+        os.killpg(pid, signal.SIGKILL)  # processes started by the solution
+    except OSError:
+        pass
+    return {'returncode': _returncode(status), 'timeout': timeout[0], 'time': wall, 'cpu_time': usage.ru_utime + usage.ru_stime, 'memory': max(_memory(usage) - (baseline or 0), 0)}
+
+
+def run_once(request: dict, report: int):
+    """
+    Run the solution without worker pool (Checker.run without fork server), it is forked from this fresh interpreter as from a worker,
+    because ru_maxrss of a process started by exec includes memory of the process that started it (the judge),
+    so memory is limited and counted the same way, {'returncode': int, 'cpu_time': float, 'memory': int} is written to report
+    """
+    ready_r, ready_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_r)
+        os.close(report)
+        try:
+            code = _start(request, ready_w)
+        except BaseException:
+            traceback.print_exc()
+            sys.stderr.flush()
+            os._exit(1)
+        _execute(code, code.co_filename)
+    os.close(ready_w)
+    os.close(0)  # stdin and stdout belong to the solution only
+    os.close(1)
+    baseline = _started(ready_r)
+    _, status, usage = os.wait4(pid, 0)
+    os.write(report, json.dumps({'returncode': _returncode(status), 'cpu_time': usage.ru_utime + usage.ru_stime, 'memory': max(_memory(usage) - (baseline or 0), 0)}).encode('UTF-8'))
+    os._exit(0)
+
+
+def serve(fd: int):
+    """Worker main loop, one request at a time"""
+    sock = socket.socket(fileno=fd)
+    while True:
+        request, fds = _recv(sock)
+        if request is None:
+            break
+        _send(sock, _compile(request) if request['cmd'] == 'compile' else _run(sock, request, fds))
+
+
+def kill_group(pid: int):
+    """Kill process and everything it started"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        try:
+            os.kill(pid, signal.SIGKILL)  # process did not create its group yet
+        except OSError:
+            pass
+
+
+def wait(pid: int, timeout: float) -> (int, object, bool):
+    """Wait for the child started without fork server, return status, resource usage and True if it was killed by timeout"""
+    lock, finished, killed = threading.Lock(), [False], [False]
+
+    def kill():
+        with lock:
+            if not finished[0]:  # child is not reaped yet, so its pid can't belong to other process
+                killed[0] = True
+                kill_group(pid)
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)  # sleeps until the child ends, leaves it to wait4 below
+    with lock:
+        finished[0] = True
+    timer.cancel()
+    _, status, usage = os.wait4(pid, 0)
+    return status, usage, killed[0]
+
+
+class Result:
+    """How the run ended: returncode, stderr, timeout, wall and cpu time in seconds, peak memory in KB above the interpreter before the solution"""
+
+    def __init__(self, returncode: int, stderr='', timeout=False, time=None, cpu_time=None, memory=None):
+        self.returncode = returncode
+        self.stderr = stderr
+        self.timeout = timeout
+        self.time = time
+        self.cpu_time = cpu_time
+        self.memory = memory
+
+    @staticmethod
+    def from_usage(status: int, usage, stderr: str, timeout: bool, time: float):
+        return Result(_returncode(status), stderr, timeout, time, usage.ru_utime + usage.ru_stime, _memory(usage))
+
+    def __repr__(self):
+        return f"Result(returncode={self.returncode}, timeout={self.timeout}, time={self.time}, memory={self.memory})"
+
+
+def communicate(data: bytes, stdin: int, stdout: int, stderr: int, output, kill, timeout=None) -> (bytes, bool):
+    """
+    Write data to stdin and pass stdout chunk by chunk to output.feed(chunk), process is killed by kill()
+    when output.feed returns False or after timeout seconds, stderr is kept up to STDERR_LIMIT bytes,
+    return stderr and True if process was killed by timeout, all descriptors are closed
+    """
+    errors = []
+    kept = 0
+    offset = 0
+    timed_out = False
+    deadline = None if timeout is None else perf_counter() + timeout
+    os.set_blocking(stdin, False)
+    with selectors.DefaultSelector() as selector:
+        if data:
+            selector.register(stdin, selectors.EVENT_WRITE)
+        else:
+            os.close(stdin)
+        selector.register(stdout, selectors.EVENT_READ)
+        selector.register(stderr, selectors.EVENT_READ)
+        while selector.get_map():
+            if deadline is not None and perf_counter() > deadline and not timed_out:
+                timed_out = True
+                kill()
+            events = selector.select(None if deadline is None or timed_out else max(deadline - perf_counter(), 0))
+            for key, _ in events:
+                fd = key.fd
+                if fd == stdin:
+                    try:
+                        offset += os.write(fd, data[offset:offset + CHUNK])
+                    except BlockingIOError:
+                        pass
+                    except BrokenPipeError:
+                        offset = len(data)
+                    if offset >= len(data):
+                        selector.unregister(fd)
+                        os.close(fd)
+                    continue
+                chunk = os.read(fd, CHUNK)
+                if not chunk:
+                    selector.unregister(fd)
+                    os.close(fd)
+                elif fd == stdout and not output.feed(chunk):
+                    kill()
+                    selector.unregister(fd)
+                    os.close(fd)
+                elif fd == stderr and kept < STDERR_LIMIT:
+                    errors.append(chunk[:STDERR_LIMIT - kept])
+                    kept += len(errors[-1])
+    output.finish()
+    return b''.join(errors), timed_out
+
+
+class ForkServer:
+    """Pool of warm workers, every worker runs one test at a time"""
+    script = os.path.abspath(__file__)  # started by PYTHON_INTERPRETER as a worker or by Checker.run as run_once()
+
+    def __init__(self, python: str, size: int):
+        self.python = python
+        self.size = size
+        self.idle = Queue()
+        self.lock = threading.Lock()
+        self.started = 0
+        self.encoding = getpreferredencoding(False)
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(os, 'fork') and hasattr(socket, 'SOCK_SEQPACKET') and hasattr(socket, 'SCM_RIGHTS')
+
+    def run(self, file: str, inp, time_limit: float, output, memory_limit=None) -> Result:
+        """
+        Run file with inp (str or encoded bytes/mmap) as stdin, stdout is passed to output.feed(chunk) (see comparator.py),
+        solution can allocate memory_limit bytes more than an empty interpreter (None - no limit)
+        """
+        worker = self.__take()
+        try:
+            result = self.__communicate(worker, {'cmd': 'run', 'file': file, 'time_limit': time_limit, 'memory_limit': memory_limit}, inp.encode(self.encoding) if isinstance(inp, str) else inp, output)
+        except (OSError, ValueError, TypeError):
+            self.__kill(worker)
+            raise
+        self.idle.put(worker)
+        return result
+
+    def compile(self, file: str, target: str):
+        """Byte-compile file into target, return None or error message if file has syntax errors"""
+        worker = self.__take()
+        try:
+            _send(worker[1], {'cmd': 'compile', 'file': file, 'target': target})
+            result, _ = _recv(worker[1])
+            if result is None:
+                raise OSError('fork server worker died')
+        except OSError:
+            self.__kill(worker)
+            raise
+        self.idle.put(worker)
+        return result['error']
+
+    def close(self):
+        """Stop idle workers"""
+        while True:
+            try:
+                self.__kill(self.idle.get_nowait())
+            except Empty:
+                break
+
+    def __take(self):
+        while True:
+            with self.lock:
+                if self.idle.empty() and self.started < self.size:
+                    self.started += 1
+                    return self.__start()
+            try:
+                return self.idle.get(timeout=1)  # check again if some worker was killed meanwhile
+            except Empty:
+                pass
+
+    def __start(self):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = subprocess.Popen([self.python, ForkServer.script, str(child.fileno())], pass_fds=[child.fileno()], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        child.close()
+        return process, parent
+
+    def __kill(self, worker):
+        process, sock = worker
+        sock.close()
+        process.kill()
+        process.wait()
+        with self.lock:
+            self.started -= 1
+
+    def __communicate(self, worker, request: dict, data: bytes, output) -> Result:
+        process, sock = worker
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        try:
+            _send(sock, request, [stdin_r, stdout_w, stderr_w])
+            started, _ = _recv(sock)
+        except OSError:
+            started = None
+        finally:
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+        if started is None:
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise OSError('fork server worker died')
+        errors, _ = communicate(data, stdin_w, stdout_r, stderr_r, output, lambda: kill_group(started['pid']))
+        result, _ = _recv(sock)
+        if result is None:
+            raise OSError('fork server worker died')
+        return Result(result['returncode'], errors.decode(self.encoding, errors='replace'), result['timeout'], result['time'], result['cpu_time'], result['memory'])
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'run':
+        run_once(json.loads(sys.argv[2]), int(sys.argv[3]))
+    else:
+        serve(int(sys.argv[1]))
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, BooleanField, FileField, FloatField, TextAreaField
-from wtforms.validators import DataRequired
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, FileField, FloatField, TextAreaField, IntegerField
+from wtforms.validators import DataRequired, Optional
 
 
 class RegisterForm(FlaskForm):
@@ -40,6 +40,7 @@ class CreateTask(FlaskForm):
     description = TextAreaField('Описание задачи', validators=[DataRequired()])
     reference = FileField('Файл с эталоном решения', validators=[DataRequired()])
     time_limit = FloatField('Оптимальное время прохождения тестов (секунды)', validators=[DataRequired()])
+    memory_limit = IntegerField('Ограничение памяти (мегабайты)', validators=[Optional()])
     tests = FileField('Файл с тестами', validators=[DataRequired()])
     submit = SubmitField('Готово')
 
@@ -49,6 +50,7 @@ class EditTask(FlaskForm):
     description = TextAreaField('Описание задачи')
     reference = FileField('Файл с эталоном решения')
     time_limit = FloatField('Оптимальное время прохождения тестов (секунды)')
+    memory_limit = IntegerField('Ограничение памяти (мегабайты)', validators=[Optional()])
     tests = FileField('Файл с тестами')
     submit = SubmitField('Готово')
 
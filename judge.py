@@ -0,0 +1,174 @@
+import threading
+import traceback
+from collections import OrderedDict
+from time import time
+from os import environ
+from db_session import remove_session
+from test_system import Checker
+from scratch import Scratch
+
+
+class Judge:
+    """
+    Bounded queue of attempts checked by a fixed number of worker threads,
+    attempts are taken by priority class, inside the class users are served in turn
+    """
+    CONTEST = 0  # attempt in a running contest
+    PRACTICE = 1  # attempt in contest 0 or in a finished contest
+    REJUDGE = 2  # retry of an attempt or check of a task reference
+    BATCH = 3  # background rejudge after tests of the task are changed, taken only when there is nothing else
+    classes = {CONTEST: 'contest', PRACTICE: 'practice', REJUDGE: 'rejudge', BATCH: 'batch'}
+    limited = (CONTEST, PRACTICE)  # classes of attempts sent by users, counted against Judge.user_limit
+    workers_count = int(environ.get('JUDGE_WORKERS', 2))  # attempts checked at the same time
+    queue_size = int(environ.get('JUDGE_QUEUE_SIZE', 200))  # attempts waiting for a free worker
+    aging = float(environ.get('JUDGE_AGING', 30))  # seconds of waiting that raise attempt by one class
+    user_limit = int(environ.get('JUDGE_USER_LIMIT', 5))  # attempts of one user waiting or being checked at the same time
+    batch_limit = int(environ.get('JUDGE_BATCH_LIMIT', 1))  # background rejudges checked at the same time
+    database_queue = environ.get('JUDGE_DATABASE_QUEUE', 'False') == 'True'  # attempts are checked by judge_worker.py, not by threads
+    max_tries = int(environ.get('JUDGE_MAX_TRIES', 3))  # times job of judge_worker.py is taken before its attempt gets JE status
+    history_size = 1000  # how many wait times are remembered
+
+    def __init__(self):
+        self.queue = []  # [(priority, submit_time, attempt_id, user_id), ...]
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.workers = []
+        self.busy = 0
+        self.unfinished = 0
+        self.batch = OrderedDict()  # attempt_id: user_id, background rejudges, not limited by Judge.queue_size
+        self.batch_running = 0
+        self.in_flight = {}  # user_id: attempts of Judge.limited classes waiting or being checked
+        self.running = {}  # user_id: attempts being checked
+        self.served = {}  # user_id: time when attempt of the user was taken last time
+        self.wait_times = OrderedDict()
+
+    def start(self):
+        """Start workers if they are not started yet"""
+        with self.lock:
+            if self.workers:
+                return
+            Scratch.clean_stale()
+            for ind in range(Judge.workers_count):
+                worker = threading.Thread(target=self.__work, name=f'judge-{ind}', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def full(self) -> bool:
+        """Return True if there is no place for a new attempt"""
+        with self.lock:
+            return len(self.queue) >= Judge.queue_size
+
+    def user_full(self, user_id: int) -> bool:
+        """Return True if user already has Judge.user_limit attempts (rejudges are not counted) waiting or being checked"""
+        with self.lock:
+            return self.in_flight.get(user_id, 0) >= Judge.user_limit
+
+    def submit(self, attempt_id: int, priority=PRACTICE, user_id=None) -> bool:
+        """
+        Put attempt of the user into the queue with priority class (Judge.CONTEST/PRACTICE/REJUDGE),
+        return False if queue is full or user has Judge.user_limit attempts of Judge.limited classes in it
+        """
+        self.start()
+        with self.condition:
+            if len(self.queue) >= Judge.queue_size:
+                return False
+            if priority in Judge.limited:
+                if self.in_flight.get(user_id, 0) >= Judge.user_limit:
+                    return False
+                self.in_flight[user_id] = self.in_flight.get(user_id, 0) + 1
+            self.queue.append((priority, time(), attempt_id, user_id))
+            self.unfinished += 1
+            self.condition.notify_all()
+            return True
+
+    def submit_batch(self, attempts: list):
+        """Add [(attempt_id, user_id), ...] to background rejudge, attempt that is already there is added once"""
+        self.start()
+        with self.condition:
+            for attempt_id, user_id in attempts:
+                if attempt_id not in self.batch:
+                    self.batch[attempt_id] = user_id
+                    self.unfinished += 1
+            self.condition.notify_all()
+
+    def join(self):
+        """Wait until every submitted attempt is checked"""
+        with self.condition:
+            while self.unfinished:
+                self.condition.wait()
+
+    def get_wait_time(self, attempt_id: int):
+        """Return seconds attempt spent in the queue or None if it was not taken yet"""
+        return self.wait_times.get(attempt_id)
+
+    def get_stats(self) -> dict:
+        """Return {'workers': int, 'busy': int, 'queue_size': int, 'queue_limit': int, 'average_wait': float, 'classes': {name: int}, 'users': int}, batch class is background rejudge"""
+        with self.lock:
+            waits = list(self.wait_times.values())
+            return {'workers': len(self.workers),
+                    'busy': self.busy,
+                    'queue_size': len(self.queue),
+                    'queue_limit': Judge.queue_size,
+                    'average_wait': sum(waits) / len(waits) if waits else 0.0,
+                    'classes': {name: len(self.batch) if priority == Judge.BATCH else sum(1 for job in self.queue if job[0] == priority) for priority, name in Judge.classes.items()},
+                    'users': len(self.in_flight)}
+
+    def __take(self) -> tuple:
+        """
+        Return (priority, submit_time, attempt_id, user_id) with the best class, every Judge.aging seconds of waiting
+        raise attempt by one class, inside the class user with less attempts being checked and served earlier goes first,
+        background rejudge is taken only when the queue is empty and less than Judge.batch_limit of them are checked
+        """
+        with self.condition:
+            while not self.queue and not (self.batch and self.batch_running < Judge.batch_limit):
+                self.condition.wait()
+            now = time()
+            if self.queue:
+                job = min(self.queue, key=lambda job: (max(0, job[0] - int((now - job[1]) // Judge.aging)),
+                                                       self.running.get(job[3], 0),
+                                                       self.served.get(job[3], 0),
+                                                       job[1]))
+                self.queue.remove(job)
+            else:
+                attempt_id, user_id = self.batch.popitem(last=False)
+                job = (Judge.BATCH, now, attempt_id, user_id)
+                self.batch_running += 1
+            self.running[job[3]] = self.running.get(job[3], 0) + 1
+            self.served[job[3]] = now
+            return job
+
+    def __finish(self, priority: int, user_id):
+        with self.condition:
+            if priority == Judge.BATCH:
+                self.batch_running -= 1
+            self.busy -= 1
+            self.unfinished -= 1
+            for counter in ((self.in_flight, self.running) if priority in Judge.limited else (self.running,)):
+                counter[user_id] -= 1
+                if counter[user_id] == 0:
+                    del counter[user_id]
+            if user_id not in self.in_flight:
+                self.served.pop(user_id, None)
+            self.condition.notify_all()
+
+    def __work(self):
+        while True:
+            priority, submit_time, attempt_id, user_id = self.__take()
+            wait_time = time() - submit_time
+            with self.lock:
+                self.busy += 1
+                self.wait_times[attempt_id] = wait_time
+                while len(self.wait_times) > Judge.history_size:
+                    self.wait_times.popitem(last=False)
+                waiting = len(self.queue)
+            print(f"Попытка {attempt_id} ({Judge.classes[priority]}) ждала проверки {wait_time:.3f} c, в очереди {waiting}")
+            try:
+                Checker.check_attempt(attempt_id)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                remove_session()
+                self.__finish(priority, user_id)
+
+
+judge = Judge()
@@ -0,0 +1,88 @@
+"""
+Judge worker, checks attempts from the judge_jobs table (JUDGE_DATABASE_QUEUE=True),
+any number of workers on any number of hosts can use the same DATABASE, run 'python judge_worker.py'
+"""
+import signal
+import threading
+import traceback
+from os import environ, getpid
+from socket import gethostname
+from time import time
+
+import create_environment  # creatng environment variables
+from db_session import global_init, remove_session
+import models
+from judge import Judge
+from test_system import Checker
+from scratch import Scratch
+
+
+class Worker:
+    lease = float(environ.get('JUDGE_LEASE', 60))  # seconds job belongs to the worker without renewal
+    poll = float(environ.get('JUDGE_POLL', 1))  # seconds between checks of an empty queue
+
+    def __init__(self, threads: int):
+        self.threads = threads
+        self.stop = threading.Event()
+
+    def run(self):
+        """Check attempts in Worker.threads threads until stopped"""
+        Scratch.clean_stale()
+        restored = models.Job.restore()
+        if restored:
+            print(f"Добавлено в очередь {restored} попыток без задания")
+        workers = [threading.Thread(target=self.__work, args=(f'{gethostname()}:{getpid()}:{ind}',), name=f'judge-{ind}') for ind in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def __work(self, owner: str):
+        while not self.stop.is_set():
+            job = models.Job.claim(owner, Worker.lease)
+            remove_session()
+            if job is None:
+                self.stop.wait(Worker.poll)
+                continue
+            if models.Attempt.get_attempt(job.attempt_id) is None:
+                job.finish()
+                remove_session()
+                continue
+            print(f"Попытка {job.attempt_id} ({Judge.classes.get(job.priority)}) ждала проверки {time() - job.submitted:.3f} c, проверяет {owner}")
+            done = threading.Event()
+            renewal = threading.Thread(target=self.__renew, args=(job, done), daemon=True)
+            renewal.start()
+            try:
+                Checker.check_attempt(job.attempt_id, job)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                done.set()
+                renewal.join()
+                job.finish()
+                remove_session()
+
+    @staticmethod
+    def __renew(job, done: threading.Event):
+        try:
+            while not done.wait(Worker.lease / 3):
+                if not job.renew(Worker.lease):
+                    print(f"Попытку {job.attempt_id} забрал другой проверяющий")
+                    return
+        finally:
+            remove_session()
+
+
+def main():
+    global_init(environ.get('DATABASE', 'database.db'))
+    models.__init__()
+    worker = Worker(Judge.workers_count)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop.set())
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop.set()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,12 +11,12 @@ from requests import get
 from apscheduler.schedulers.background import BackgroundScheduler
 
 import create_environment  # creatng environment variables
-from db_session import global_init
+from db_session import global_init, remove_session
 import forms
 from models import User, Contest, Task, __init__, Attempt
 import resources
 
-global_init('database.db')
+global_init(environ.get('DATABASE', 'database.db'))
 __init__()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = environ['APP_KEY']
@@ -193,6 +193,7 @@ def task_page(contest_id, task_id):
     code_file, code, status, error, verdict, attempts = "", "", "", "", "", []
     current_time, start_time = time.time(), 0
     time_limit, title, author, description, question, input_data, output_data, task_edit, creator, edit = 0.0, "", "", "", "", [], [], "", False, False
+    memory_limit = None
     form = forms.CheckTask()
     task = Task.get_task(task_id)
 
@@ -201,7 +202,7 @@ def task_page(contest_id, task_id):
 
         title = task.title
         description = task.description
-        data = task.get_tests()[:2]
+        data = task.get_tests(2)
         input_data, output_data = [], []
 
         contest = Contest.get_contest(contest_id)
@@ -232,11 +233,16 @@ def task_page(contest_id, task_id):
                 verdict = "Задача проверяется"
             elif status == "the same solution has already been sent":
                 error = "Вы уже отправляли идетичное решение"
+            elif status == "judge queue is full":
+                error = "Очередь проверки переполнена, попробуйте позже"
+            elif status == "too many attempts of the user in the judge queue":
+                error = "Слишком много ваших попыток ждут проверки, дождитесь результатов"
         form.written_code.data = ""
 
         author = User.get_user(task.creator).username
         creator = User.get_user(current_user.id).creator
         time_limit = task.time_limit
+        memory_limit = task.memory_limit
 
         attempts = Attempt.get_attempts(contest_id, task_id, current_user.id)
 
@@ -261,6 +267,7 @@ def task_page(contest_id, task_id):
                            author=author,
                            attempts=attempts,
                            time_limit=time_limit,
+                           memory_limit=memory_limit,
                            current_id=current_user.id,
                            current_time=current_time,
                            start_time=start_time)
@@ -288,8 +295,9 @@ def create_task():
         title = form.title.data
         description = form.description.data
         time_limit = form.time_limit.data
+        memory_limit = form.memory_limit.data
 
-        status = Task.add_task(creator, time_limit, title, description, reference, tests).get("status")
+        status = Task.add_task(creator, time_limit, title, description, reference, tests, memory_limit).get("status")
         if len(reference) == 0:
             error = "Некорректный формат эталона решения"
 
@@ -321,6 +329,7 @@ def edit_task(task_id):
         if request.method == "GET":
             form.title.data = task.title
             form.time_limit.data = task.time_limit
+            form.memory_limit.data = task.memory_limit
             form.description.data = task.description
 
         if request.method == "POST":
@@ -333,11 +342,13 @@ def edit_task(task_id):
             new_title = form.title.data
             new_description = form.description.data
             new_time_limit = form.time_limit.data
+            new_memory_limit = form.memory_limit.data
 
             if len(new_reference) == 0:
                 new_reference = task.reference
 
             status = task.change_data(time_limit=new_time_limit if new_time_limit != task.time_limit else None,
+                                      memory_limit=new_memory_limit if new_memory_limit != task.memory_limit else None,
                                       title=new_title if new_title != task.title else None,
                                       description=new_description if new_description != task.description else None,
                                       reference=new_reference if new_reference != task.reference else None).get(
@@ -422,18 +433,18 @@ def contest_page(contest_id):
 
     if contest is not None:
         exist = True
-        tasks = contest.get_tasks()
+        view = contest.get_view(current_user.id)
         results = []
 
         start_time = contest.start_time
 
-        for i in tasks:
-            last_result = Attempt.get_last_result(contest_id, i.id, current_user.id)
+        for i in view['tasks']:
+            last_result = view['last'].get(i.id)
 
             results.append([i.id, i.title, last_result.status if last_result is not None else ""])
 
         edit = False
-        if str(current_user.id) in contest.creators.split(","):
+        if current_user.id in contest.get_creator_ids():
             edit = True
 
         creator = User.get_user(current_user.id).creator
@@ -466,9 +477,9 @@ def edit_contest(contest_id):
         exist = True
         if request.method == "GET":
             form.title.data = contest.title
-            form.creators.data = contest.creators
+            form.creators.data = ','.join(map(str, contest.get_creator_ids()))
             form.description.data = contest.description
-            form.tasks.data = contest.tasks
+            form.tasks.data = ','.join(map(str, contest.get_task_ids()))
 
             start = datetime.datetime.fromtimestamp(contest.start_time).strftime('%Y-%m-%d %H:%M:%S').split()
             form.start_date.data = start[0]  # нужно распарсить аремя на date и time
@@ -499,10 +510,10 @@ def edit_contest(contest_id):
             if new_start >= new_end:
                 error = "Неправильный формат даты проведения турнира"
 
-            status = contest.change_data(creators=new_creators if new_creators != contest.creators else None,
+            status = contest.change_data(creators=new_creators if {creator.strip() for creator in new_creators} != set(map(str, contest.get_creator_ids())) else None,
                                          title=new_title if new_title != contest.title else None,
                                          description=new_description if new_description != contest.description else None,
-                                         tasks=new_tasks if new_tasks != contest.tasks else None,
+                                         tasks=new_tasks if new_tasks != tuple(map(str, contest.get_task_ids())) else None,
                                          start_time=new_start if new_start != contest.start_time else None,
                                          end_time=new_end if new_end != contest.end_time else None).get("status")
             if status == "ok":
@@ -513,7 +524,7 @@ def edit_contest(contest_id):
         creator = User.get_user(current_user.id).creator
 
         edit = False
-        if current_user.id in contest.creators.split(','):
+        if current_user.id in contest.get_creator_ids():
             edit = True
 
     else:
@@ -587,7 +598,7 @@ def results_page(contest_id):
         title = contest.title
 
         edit = False
-        if current_user.id == str(contest.creators):
+        if current_user.id in contest.get_creator_ids():
             edit = True
 
         rating = enumerate(contest.get_rating())
@@ -748,6 +759,11 @@ def load_user(user_id):
     return User.get_user(user_id)
 
 
+@app.teardown_appcontext
+def close_session(exception=None):
+    remove_session()
+
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('error_pages/404.html'), 404
@@ -770,5 +786,7 @@ api.add_resource(resources.ContestsResource, '/api/v1/contests')  # get
 api.add_resource(resources.ContestResource, '/api/v1/contests/<int:contest_id>')  # get, put
 api.add_resource(resources.ContestTaskResource, '/api/v1/contests/<int:contest_id>/<int:task_id>')  # get, post
 api.add_resource(resources.AttemptResource, '/api/v1/attempts/<int:attempt_id>')  # get
+api.add_resource(resources.JudgeResource, '/api/v1/judge')  # get
+api.add_resource(resources.RejudgeResource, '/api/v1/rejudge')  # get, post
 
 app.run(host=environ.get('HOST', '0.0.0.0'), port=int(environ.get("PORT", 5000)))
@@ -0,0 +1,94 @@
+"""
+Maintenance commands, run 'python manage.py <name> --help' to see options
+
+rejudge - recheck all attempts of the task or of the contest
+clean-storage - remove files of test data that are not used by any test
+rebuild-standings - recreate results of the contests from attempts
+check-indexes - fail if frequent queries of models read whole tables, runs tests/test_query_plans.py
+"""
+import sys
+import argparse
+import subprocess
+from os import environ, path
+from time import sleep
+
+import create_environment  # creatng environment variables
+from db_session import global_init, remove_session
+import models
+from judge import Judge
+from storage import Storage
+
+
+def rejudge(args):
+    target = models.Task.get_task(args.task) if args.task is not None else models.Contest.get_contest(args.contest)
+    if target is None:
+        print(f"Нет {'задачи' if args.task is not None else 'турнира'} с id {args.task if args.task is not None else args.contest}")
+        return 1
+    result = target.rejudge(force=args.force)
+    print(f"Поставлено на перепроверку {result['queued']}, пропущено без изменений {result['skipped']}")
+    if Judge.database_queue and not args.wait:
+        return 0  # attempts are checked by judge_worker.py
+    progress = target.get_rejudge_progress()
+    while progress['done'] < progress['total']:
+        print(f"Перепроверено {progress['done']} из {progress['total']}")
+        sleep(args.interval)
+        remove_session()  # attempts are checked by other threads
+        progress = target.get_rejudge_progress()
+    print(f"Перепроверено {progress['done']} из {progress['total']}")
+    return 0
+
+
+def clean_storage(args):
+    session = models.create_session()
+    used = set()
+    for input_hash, output_hash in session.query(models.Test.input_hash, models.Test.output_hash):
+        used.update((input_hash, output_hash))
+    print(f"Удалено файлов {Storage.clean(used, args.age)} из {Storage.root}")
+    return 0
+
+
+def rebuild_standings(args):
+    if args.contest is not None and models.Contest.get_contest(args.contest) is None:
+        print(f"Нет турнира с id {args.contest}")
+        return 1
+    print(f"Записано строк результатов: {models.Standing.rebuild(args.contest)}")
+    return 0
+
+
+def check_indexes(args):
+    test = path.join(path.dirname(path.abspath(__file__)), 'tests', 'test_query_plans.py')
+    return subprocess.call([sys.executable, '-m', 'pytest', '-q', test] + (['-s'] if args.verbose else []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintenance commands')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('rejudge', help='recheck attempts of the task or of the contest, unchanged attempts are skipped')
+    target = command.add_mutually_exclusive_group(required=True)
+    target.add_argument('--task', type=int, help='id of the task')
+    target.add_argument('--contest', type=int, help='id of the contest')
+    command.add_argument('--force', action='store_true', help='check attempts again even if nothing changed, previous trials are removed')
+    command.add_argument('--wait', action='store_true', help='wait for judge_worker.py when JUDGE_DATABASE_QUEUE=True')
+    command.add_argument('--interval', type=float, default=5, help='seconds between progress reports')
+    command.set_defaults(run=rejudge)
+    command = commands.add_parser('clean-storage', help='remove files of test data that are not used by any test')
+    command.add_argument('--age', type=float, default=3600, help='files newer than that many seconds are kept, they can belong to a test being added')
+    command.set_defaults(run=clean_storage)
+    command = commands.add_parser('rebuild-standings', help='recreate results of the contests from checked attempts')
+    command.add_argument('--contest', type=int, help='id of the contest, every contest by default')
+    command.set_defaults(run=rebuild_standings)
+    command = commands.add_parser('check-indexes', help='run EXPLAIN QUERY PLAN on frequent queries of models, fail if any of them reads a whole table')
+    command.add_argument('--verbose', action='store_true', help='print plans of every query')
+    command.set_defaults(run=check_indexes)
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return 0
+    if args.run is not check_indexes:  # tests make their own database
+        global_init(environ.get('DATABASE', 'database.db'))
+        models.__init__()
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
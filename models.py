@@ -1,35 +1,73 @@
 import sqlalchemy
+from sqlalchemy.orm import deferred
 from db_session import SqlAlchemyBase, create_session
 from flask_login import UserMixin
 from random import choice
-from hashlib import sha3_256
+from zlib import compress, decompress
+from hashlib import sha3_256, sha256
+from json import dumps, loads
 from time import time
 from test_system import Checker
 from email_sender import send_email
 from os import environ
-import threading
+from judge import Judge, judge
+from storage import Storage
 
 
 def __init__():
     session = create_session()
     if Contest.get_contest(contest_id=0) is None:
-        session.add(Contest(id=0, creators='', title='Tasks', description='Contest with all tasks', start_time=0, end_time=pow(2, 34), tasks=''))
+        session.add(Contest(id=0, title='Tasks', description='Contest with all tasks', start_time=0, end_time=pow(2, 34)))
         session.commit()
+    if session.query(Standing.id).first() is None:
+        Standing.rebuild()  # database created before standings
 
 
 def _like(text: str) -> str:
     return '%' + text + '%'
 
 
+def _submit(attempt_id: int, priority: int, user_id: int) -> bool:
+    """Give attempt to the judge threads or to the queue table for judge_worker.py (JUDGE_DATABASE_QUEUE)"""
+    if Judge.database_queue:
+        return Job.add_job(attempt_id, priority, user_id)
+    return judge.submit(attempt_id, priority, user_id)
+
+
+def _rejudge(task_id: int):
+    """Recheck checked attempts of the task in background after its tests are changed, only tests without current trials are run"""
+    Attempt.rejudge(Attempt.task_id == task_id)
+
+
 class Test(SqlAlchemyBase):
     __tablename__ = 'tests'
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    task_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tasks.id"), nullable=False)
-    input = sqlalchemy.Column(sqlalchemy.String, nullable=False)
-    output = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    task_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tasks.id"), nullable=False, index=True)
+    input_hash = sqlalchemy.Column(sqlalchemy.String, nullable=True, index=True)  # input and output are kept in Storage
+    output_hash = sqlalchemy.Column(sqlalchemy.String, nullable=True)
     points = sqlalchemy.Column(sqlalchemy.Integer, default=1)
 
+    @property
+    def input(self) -> str:
+        return Storage.read(self.input_hash)
+
+    @input.setter
+    def input(self, text: str):
+        self.input_hash = Storage.put(text)
+
+    @property
+    def output(self) -> str:
+        return Storage.read(self.output_hash)
+
+    @output.setter
+    def output(self, text: str):
+        self.output_hash = Storage.put(text)
+
+    def get_hash(self) -> str:
+        """Return hash of input and output"""
+        return sha256(dumps([self.input_hash, self.output_hash]).encode('UTF-8')).hexdigest()
+
     def change_data(self, inp=None, points=None):
         """
         Change input/output/points, return
@@ -42,7 +80,7 @@ class Test(SqlAlchemyBase):
             session = create_session()
             assert inp is None or type(inp) == str, 'invalid input type, expected str'
             assert points is None or type(points) == int, 'invalid input type, expected int'
-            assert len(session.query(Test).filter(Test.task_id == self.task_id, Test.input == (self.input if inp is None else inp)).all()) == 0, 'same test has already been added'
+            assert len(session.query(Test).filter(Test.task_id == self.task_id, Test.input_hash == (self.input_hash if inp is None else Storage.hash(inp))).all()) == 0, 'same test has already been added'
             test = session.query(Test).filter(Test.id == self.id).first()
             if inp is not None:
                 output = Checker.get_output(self.task_id, inp)
@@ -52,6 +90,8 @@ class Test(SqlAlchemyBase):
             if points is not None:
                 self.points = test.points = points
             session.commit()
+            Verdict.clear(self.task_id)
+            _rejudge(self.task_id)
             return {'status': 'ok'}
         except AssertionError as ex:
             return {'status': ex.args[0]}
@@ -61,11 +101,13 @@ class Test(SqlAlchemyBase):
         session = create_session()
         session.delete(session.query(Test).filter(Test.id == self.id).first())
         session.commit()
+        Verdict.clear(self.task_id)
+        _rejudge(self.task_id)
 
     @staticmethod
-    def get_test(test_id: int):
+    def get_test(test_id: int, session=None):
         """Return Test(**kwargs) by test_id or None if id is invalid"""
-        session = create_session()
+        session = create_session() if session is None else session
         return session.query(Test).filter(Test.id == test_id).first()
 
     @staticmethod
@@ -83,7 +125,7 @@ class Test(SqlAlchemyBase):
             assert len(session.query(Task).filter(Task.id == task_id).all()) == 1, f'no task with id \'{task_id}\''
             assert type(inp) == str, 'invalid input type, expected str'
             assert points is None or type(points) == int, 'invalid points type, expected int'
-            assert len(session.query(Test).filter(Test.task_id == task_id, Test.input == inp).all()) == 0, 'same test has already been added'
+            assert len(session.query(Test).filter(Test.task_id == task_id, Test.input_hash == Storage.hash(inp)).all()) == 0, 'same test has already been added'
             output = Checker.get_output(task_id, inp)
             assert output[0] == 'OK', f'invalid input for the reference, code gives error {output[0]}'
             session.add(Test(task_id=task_id,
@@ -91,12 +133,52 @@ class Test(SqlAlchemyBase):
                              output=output[1],
                              points=points))
             session.commit()
-            return {'status': 'ok', 'id': session.query(Test).filter(Test.task_id == task_id, Test.input == inp).first().id}
+            Verdict.clear(task_id)
+            _rejudge(task_id)
+            return {'status': 'ok', 'id': session.query(Test).filter(Test.task_id == task_id, Test.input_hash == Storage.hash(inp)).first().id}
         except AssertionError as ex:
             return {'status': ex.args[0]}
 
+    @staticmethod
+    def add_tests(task_id: int, tests: list) -> list:
+        """
+        Add tests [{'input': str, 'points': int or None}, ...] to database in one transaction,
+        reference outputs are generated in parallel, return status of every test same as Test.add_test(**kwargs)
+        """
+        session = create_session()
+        if len(session.query(Task).filter(Task.id == task_id).all()) != 1:
+            return [{'status': f'no task with id \'{task_id}\''} for _ in tests]
+        statuses = [None] * len(tests)
+        inputs = set(key for key, in session.query(Test.input_hash).filter(Test.task_id == task_id))
+        checked = []
+        for ind, test in enumerate(tests):
+            inp, points = test.get('input'), test.get('points')
+            if type(inp) != str:
+                statuses[ind] = {'status': 'invalid input type, expected str'}
+            elif points is not None and type(points) != int:
+                statuses[ind] = {'status': 'invalid points type, expected int'}
+            elif Storage.hash(inp) in inputs:
+                statuses[ind] = {'status': 'same test has already been added'}
+            else:
+                inputs.add(Storage.hash(inp))
+                checked.append(ind)
+        added = []
+        for ind, output in zip(checked, Checker.get_outputs(task_id, [tests[ind]['input'] for ind in checked])):
+            if output[0] == 'OK':
+                added.append((ind, Test(task_id=task_id, input=tests[ind]['input'], output=output[1], points=tests[ind].get('points'))))
+            else:
+                statuses[ind] = {'status': f'invalid input for the reference, code gives error {output[0]}'}
+        session.add_all([test for ind, test in added])
+        session.commit()
+        for ind, test in added:
+            statuses[ind] = {'status': 'ok', 'id': test.id}
+        Verdict.clear(task_id)
+        if added:
+            _rejudge(task_id)
+        return statuses
+
     def __repr__(self):
-        return f"Test(input='{self.input}', output='{self.output}')"
+        return f"Test(input_hash='{self.input_hash}', output_hash='{self.output_hash}')"
 
 
 class Task(SqlAlchemyBase):
@@ -105,46 +187,58 @@ class Task(SqlAlchemyBase):
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     creator = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), nullable=False)
     time_limit = sqlalchemy.Column(sqlalchemy.Float, nullable=False)
+    memory_limit = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)  # MB, None - no limit
     title = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     description = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     reference = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     attempts = sqlalchemy.Column(sqlalchemy.Integer, default=0)
     successful = sqlalchemy.Column(sqlalchemy.Integer, default=0)
 
-    def change_data(self, time_limit=None, title=None, description=None, reference=None):
+    def change_data(self, time_limit=None, title=None, description=None, reference=None, memory_limit=None):
         """
-        Change title/description/reference/time_limit, return
+        Change title/description/reference/time_limit/memory_limit, new reference is sent as an attempt of the creator
+        to be checked in background and nothing is changed if it can't be queued, return
         {'status': 'ok'}
         {'status': 'same task has already been added'}
-        {'status': 'invalid <title/description/reference/time_limit> type, expected <str/int/float> or None'}
+        {'status': 'judge queue is full'}
+        {'status': 'invalid <title/description/reference/time_limit/memory_limit> type, expected <str/int/float> or None'}
         """
         try:
             session = create_session()
             assert time_limit is None or type(time_limit) == int or type(time_limit) == float, 'invalid time_limit type, expected float or int or None'
+            assert memory_limit is None or type(memory_limit) == int, 'invalid memory_limit type, expected int or None'
             assert title is None or type(title) == str, 'invalid title type, expected str or None'
             assert description is None or type(description) == str, 'invalid description type, expected str or None'
             assert reference is None or type(reference) == str, 'invalid reference type, expected str or None'
             assert len(session.query(Task).filter(Task.creator == self.creator, Task.time_limit == (self.time_limit if time_limit is None else time_limit), Task.title == (self.title if title is None else title), Task.description == (self.description if description is None else description), Task.reference == (self.reference if reference is None else reference)).all()) == 0, "same task has already been added"
+            if reference is not None:  # queued before other changes, add_attempt() commits the session
+                result = Attempt.add_attempt(contest_id=0, solution=reference, task_id=self.id, user_id=self.creator, priority=Judge.REJUDGE)
+                assert result['status'] in ('ok', 'the same solution has already been sent'), result['status']
             task = session.query(Task).filter(Task.id == self.id).first()
             if time_limit is not None:
                 self.time_limit = task.time_limit = time_limit
+            if memory_limit is not None:
+                self.memory_limit = task.memory_limit = memory_limit if memory_limit > 0 else None
             if title is not None:
                 self.title = task.title = title
             if description is not None:
                 self.description = task.description = description
             if reference is not None:
-                status, attempt_id = Attempt.add_attempt(contest_id=0, solution=reference, task_id=self.id, user_id=self.creator)
-                assert status == 'OK', f'reference failed on tests, got error {status}'
                 self.reference = task.reference = reference
             session.commit()
+            Verdict.clear(self.id)
             return {'status': 'ok'}
         except AssertionError as ex:
             return {'status': ex.args[0]}
 
-    def get_tests(self):
-        """Return [Test(**kwargs), ...] sorted by index (recent added at the back)"""
-        session = create_session()
-        return session.query(Test).filter(Test.task_id == self.id).order_by(sqlalchemy.desc(~Test.id)).all()
+    def get_tests(self, limit=None, session=None):
+        """Return [Test(**kwargs), ...] sorted by index (recent added at the back), only first limit tests if it is given"""
+        session = create_session() if session is None else session
+        return session.query(Test).filter(Test.task_id == self.id).order_by(sqlalchemy.desc(~Test.id)).limit(limit).all()
+
+    def get_tests_hash(self, tests=None) -> str:
+        """Return hash of all tests (or of given task.get_tests()), changes when any test is added, changed or removed"""
+        return sha256(dumps([(test.id, test.input_hash, test.output_hash, test.points) for test in (self.get_tests() if tests is None else tests)]).encode('UTF-8')).hexdigest()
 
     def add_test(self, inp: str, points=None):
         """Add test to database by using Test.add_test(**kwargs)"""
@@ -158,6 +252,14 @@ class Task(SqlAlchemyBase):
         self.successful = task.successful = task.successful + successful
         session.commit()
 
+    def rejudge(self, force=False) -> dict:
+        """Recheck attempts of the task, see Attempt.rejudge()"""
+        return Attempt.rejudge(Attempt.task_id == self.id, force)
+
+    def get_rejudge_progress(self) -> dict:
+        """See Attempt.get_rejudge_progress()"""
+        return Attempt.get_rejudge_progress(Attempt.task_id == self.id)
+
     def delete_attempt(self):
         """Delete attempt from database"""
         session = create_session()
@@ -181,9 +283,9 @@ class Task(SqlAlchemyBase):
         return session.query(Task).order_by(sqlalchemy.desc(sort.get(sort_type, sort['easy']))).all()
 
     @staticmethod
-    def get_task(task_id: int):
+    def get_task(task_id: int, session=None):
         """Return Task(**kwargs) by task_id or None if id is invalid"""
-        session = create_session()
+        session = create_session() if session is None else session
         return session.query(Task).filter(Task.id == task_id).first()
 
     @staticmethod
@@ -193,11 +295,11 @@ class Task(SqlAlchemyBase):
         return session.query(Task).filter(Task.title.like(_like(title))).all()
 
     @staticmethod
-    def add_task(creator: int, time_limit: float, title: str, description: str, reference: str, tests=None) -> dict:
+    def add_task(creator: int, time_limit: float, title: str, description: str, reference: str, tests=None, memory_limit=None) -> dict:
         """
-        Add task to database, return:
+        Add task to database, memory_limit is in MB, return:
         {'status': 'ok', 'id': int, 'tests_statuses': list}
-        {'status': 'invalid <time_limit/title/description/reference/tests> type, expected <str/int/float/list/tuple/None>'}
+        {'status': 'invalid <time_limit/memory_limit/title/description/reference/tests> type, expected <str/int/float/list/tuple/None>'}
         {'status': 'no user with id '<creator>''}
         {'status': 'same task has already been added'}
         """
@@ -205,6 +307,7 @@ class Task(SqlAlchemyBase):
             session = create_session()
             assert User.get_user(creator) is not None, f"no user with id '{creator}'"
             assert type(time_limit) == int or type(time_limit) == float, 'invalid time_limit type, expected int or float'
+            assert memory_limit is None or type(memory_limit) == int, 'invalid memory_limit type, expected int or None'
             assert type(title) == str, 'invalid title type, expected str'
             assert type(description) == str, 'invalid description type, expected str'
             assert type(reference) == str, 'invalid reference type, expected str'
@@ -213,14 +316,13 @@ class Task(SqlAlchemyBase):
             assert len(session.query(Task).filter(Task.creator == creator, Task.time_limit == time_limit, Task.title == title, Task.description == description, Task.reference == reference).all()) == 0, "same task has already been added"
             session.add(Task(creator=creator,
                              time_limit=time_limit,
+                             memory_limit=memory_limit if memory_limit else None,
                              title=title,
                              description=description,
                              reference=reference))
             session.commit()
             task_id = session.query(Task).filter(Task.creator == creator, Task.time_limit == time_limit, Task.title == title, Task.description == description, Task.reference == reference).first().id
-            tests_statuses = []
-            for test in (tests if tests is not None else []):
-                tests_statuses.append(Test.add_test(task_id=task_id, inp=str(test.get('input')), points=test.get('points')))
+            tests_statuses = Test.add_tests(task_id, [{'input': str(test.get('input')), 'points': test.get('points')} for test in (tests if tests is not None else [])])
             return {'status': 'ok', 'id': task_id, 'tests_statuses': tests_statuses}
         except AssertionError as ex:
             return {'status': ex.args[0]}
@@ -233,10 +335,8 @@ class Contest(SqlAlchemyBase):
     __tablename__ = 'contests'
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    creators = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     title = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     description = sqlalchemy.Column(sqlalchemy.String, nullable=False)
-    tasks = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     start_time = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
     end_time = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
 
@@ -260,21 +360,28 @@ class Contest(SqlAlchemyBase):
                 assert User.get_user(creator) is not None, f"no user with id '{creator}'"
             for task in ([] if tasks is None else tasks):
                 assert Task.get_task(task) is not None, f"no task with id '{task}'"
-            assert len(session.query(Contest).filter(Contest.creators == (self.creators if creators is None else ','.join(creators)), Contest.title == (self.title if title is None else title), Contest.description == (self.description if description is None else description), Contest.tasks == (self.tasks if tasks is None else ','.join(tasks)), Contest.start_time == (self.start_time if start_time is None else start_time), Contest.end_time == (self.end_time if end_time is None else end_time)).all()) == 0, 'same contest has already been added'
+            creator_ids = self.get_creator_ids() if creators is None else list(dict.fromkeys(map(int, creators)))
+            task_ids = self.get_task_ids() if tasks is None else list(map(int, tasks))
+            assert not Contest.__exists(session, creator_ids, self.title if title is None else title, self.description if description is None else description, task_ids,
+                                        self.start_time if start_time is None else start_time, self.end_time if end_time is None else end_time, self.id), 'same contest has already been added'
             contest = session.query(Contest).filter(Contest.id == self.id).first()
             if creators is not None:
-                self.creators = contest.creators = ','.join(creators)
+                session.query(ContestCreator).filter(ContestCreator.contest_id == self.id).delete(synchronize_session=False)
+                session.add_all([ContestCreator(contest_id=self.id, user_id=user_id) for user_id in creator_ids])
             if title is not None:
                 self.title = contest.title = title
             if description is not None:
                 self.description = contest.description = description
             if tasks is not None:
-                self.tasks = contest.tasks = ','.join(tasks)
+                session.query(ContestTask).filter(ContestTask.contest_id == self.id).delete(synchronize_session=False)
+                session.add_all([ContestTask(contest_id=self.id, position=position, task_id=task_id) for position, task_id in enumerate(task_ids)])
             if start_time is not None:
                 self.start_time = contest.start_time = start_time
             if end_time is not None:
                 self.end_time = contest.end_time = end_time
             session.commit()
+            if tasks is not None or start_time is not None or end_time is not None:
+                Standing.rebuild(self.id)
             return {'status': 'ok'}
         except AssertionError as ex:
             return {'status': ex.args[0]}
@@ -283,22 +390,66 @@ class Contest(SqlAlchemyBase):
         """Return [Task(**kwargs), Attempt(**kwargs)] by user_id for """
         return [(task, Attempt.get_best_result(contest_id=self.id, task_id=task.id, user_id=user_id)) for task in self.get_tasks()]
 
-    def get_tasks(self):
-        """Return [Task(**kwargs), ...]"""
-        return [Task.get_task(task_id) for task_id in map(int, self.tasks.split(','))] if self.tasks else []
+    def get_tasks(self, session=None):
+        """Return [Task(**kwargs), ...] in the order of the contest"""
+        session = create_session() if session is None else session
+        return session.query(Task).join(ContestTask, ContestTask.task_id == Task.id).filter(ContestTask.contest_id == self.id).order_by(ContestTask.position).all()
+
+    def rejudge(self, force=False) -> dict:
+        """Recheck attempts sent to the contest, see Attempt.rejudge()"""
+        return Attempt.rejudge(Attempt.contest_id == self.id, force)
 
-    def get_creators(self):
+    def get_rejudge_progress(self) -> dict:
+        """See Attempt.get_rejudge_progress()"""
+        return Attempt.get_rejudge_progress(Attempt.contest_id == self.id)
+
+    def get_creators(self, session=None):
         """Return [User(**kwargs), ...]"""
-        return [User.get_user(user_id) for user_id in map(int, self.creators.split(','))]
+        session = create_session() if session is None else session
+        return session.query(User).join(ContestCreator, ContestCreator.user_id == User.id).filter(ContestCreator.contest_id == self.id, User.registered == True).order_by(User.id).all()
+
+    def get_creator_ids(self, session=None) -> list:
+        """Return [user_id, ...] of the creators"""
+        session = create_session() if session is None else session
+        return [user_id for user_id, in session.query(ContestCreator.user_id).filter(ContestCreator.contest_id == self.id).order_by(ContestCreator.user_id)]
+
+    def get_view(self, user_id: int, task_ids=None, solutions=False) -> dict:
+        """
+        Return everything contest pages show in 4 queries (5 with solutions) whatever the number of tasks:
+        {'tasks': [Task(**kwargs), ...], 'creators': [User(**kwargs), ...], 'best': {task_id: Attempt(**kwargs)}, 'last': {task_id: Attempt(**kwargs)}},
+        best and last attempts are of the user, only for task_ids if they are given, with solutions their sources are loaded too
+        """
+        tasks = self.get_tasks() if task_ids is None else [task for task in self.get_tasks() if task.id in task_ids]
+        ids = [task.id for task in tasks] if task_ids is None else list(task_ids)
+        best, last = Attempt.get_best_results(self.id, ids, user_id), Attempt.get_last_results(self.id, ids, user_id)
+        if solutions:
+            Attempt.load_solutions(list(best.values()) + list(last.values()))
+        return {'tasks': tasks,
+                'creators': self.get_creators(),
+                'best': best,
+                'last': last}
+
+    def get_task_ids(self, session=None) -> list:
+        """Return [task_id, ...] in the order of the contest"""
+        session = create_session() if session is None else session
+        return [task_id for task_id, in session.query(ContestTask.task_id).filter(ContestTask.contest_id == self.id).order_by(ContestTask.position)]
 
     def get_rating(self):
-        """Return [{'task_id': int, 'user_id': int, 'score': int, 'attempt': int}, ...] for each Attempt send in time"""
+        """Return [(User(**kwargs), [Standing(**kwargs) or None for each task], total score), ...] of users who sent attempts in time, best first"""
         session = create_session()
-        return sorted([(User.get_user(user[0]), [Attempt.get_best_result(self.id, task.id, user[0]) for task in self.get_tasks()], Attempt.get_tasks_sum(self.id, user[0])) for user in session.query(Attempt.user_id).filter(Attempt.contest_id == self.id, Attempt.time >= self.start_time, Attempt.time <= self.end_time).distinct()], key=lambda a: a[2], reverse=True)
+        users, scores = {}, {}
+        for standing, user in session.query(Standing, User).join(User, User.id == Standing.user_id).filter(Standing.contest_id == self.id, User.registered == True):
+            users[user.id] = user
+            scores.setdefault(user.id, {})[standing.task_id] = standing
+        task_ids = self.get_task_ids()
+        rating = [(users[user_id], [tasks.get(task_id) for task_id in task_ids], tasks[Standing.TOTAL].score if Standing.TOTAL in tasks else 0) for user_id, tasks in scores.items()]
+        return sorted(rating, key=lambda row: (-row[2], row[0].id))
 
     def delete_contest(self):
         """Delete contest from database"""
         session = create_session()
+        session.query(ContestTask).filter(ContestTask.contest_id == self.id).delete(synchronize_session=False)
+        session.query(ContestCreator).filter(ContestCreator.contest_id == self.id).delete(synchronize_session=False)
         session.delete(session.query(Contest).filter(Contest.id == self.id).first())
         session.commit()
 
@@ -313,11 +464,40 @@ class Contest(SqlAlchemyBase):
         return session.query(Contest).order_by(sqlalchemy.desc(sort.get(sort_type, sort['new']))).all()
 
     @staticmethod
-    def get_contest(contest_id: int):
+    def get_contest(contest_id: int, session=None):
         """Return Contest(**kwargs) by contest_id or None if id is invalid"""
-        session = create_session()
+        session = create_session() if session is None else session
         return session.query(Contest).filter(Contest.id == contest_id).first()
 
+    @staticmethod
+    def get_task_contests(task_id: int):
+        """Return [Contest(**kwargs), ...] with the task, contest 0 is not included"""
+        session = create_session()
+        return session.query(Contest).join(ContestTask, ContestTask.contest_id == Contest.id).filter(ContestTask.task_id == task_id).order_by(Contest.id).all()
+
+    @staticmethod
+    def get_user_contests(user_id: int):
+        """Return [Contest(**kwargs), ...] created by the user"""
+        session = create_session()
+        return session.query(Contest).join(ContestCreator, ContestCreator.contest_id == Contest.id).filter(ContestCreator.user_id == user_id).order_by(Contest.id).all()
+
+    @staticmethod
+    def get_creators_of(contest_ids: list) -> dict:
+        """Return {contest_id: [user_id, ...]} of the contests in one query"""
+        session = create_session()
+        creators = {contest_id: [] for contest_id in contest_ids}
+        for contest_id, user_id in session.query(ContestCreator.contest_id, ContestCreator.user_id).filter(ContestCreator.contest_id.in_(contest_ids)).order_by(ContestCreator.user_id):
+            creators[contest_id].append(user_id)
+        return creators
+
+    @staticmethod
+    def __exists(session, creator_ids: list, title: str, description: str, task_ids: list, start_time: int, end_time: int, contest_id=None) -> bool:
+        """Whether there is a contest other than contest_id with the same data, creators and tasks in the same order"""
+        for contest in session.query(Contest).filter(Contest.title == title, Contest.description == description, Contest.start_time == start_time, Contest.end_time == end_time, Contest.id != contest_id):
+            if contest.get_creator_ids(session) == sorted(creator_ids) and contest.get_task_ids(session) == task_ids:
+                return True
+        return False
+
     @staticmethod
     def get_contest_by_title(title: str):
         """Return [Contest(**kwargs), ...] by title where Contest.title like title"""
@@ -345,20 +525,44 @@ class Contest(SqlAlchemyBase):
                 assert User.get_user(creator) is not None, f"no user with id '{creator}'"
             for task in tasks:
                 assert Task.get_task(task) is not None, f"no task with id '{task}'"
-            assert len(session.query(Contest).filter(Contest.creators == ','.join(creators), Contest.title == title, Contest.description == description, Contest.tasks == ','.join(tasks), Contest.start_time == start_time, Contest.end_time == end_time).all()) == 0, 'same contest has already been added'
-            session.add(Contest(creators=','.join(creators),
-                                title=title,
-                                description=description,
-                                tasks=','.join(tasks),
-                                start_time=start_time,
-                                end_time=end_time))
+            creator_ids, task_ids = list(dict.fromkeys(map(int, creators))), list(map(int, tasks))
+            assert not Contest.__exists(session, creator_ids, title, description, task_ids, start_time, end_time), 'same contest has already been added'
+            contest = Contest(title=title,
+                              description=description,
+                              start_time=start_time,
+                              end_time=end_time)
+            session.add(contest)
+            session.flush()
+            session.add_all([ContestCreator(contest_id=contest.id, user_id=user_id) for user_id in creator_ids])
+            session.add_all([ContestTask(contest_id=contest.id, position=position, task_id=task_id) for position, task_id in enumerate(task_ids)])
             session.commit()
-            return {'status': 'ok', 'id': session.query(Contest).filter(Contest.creators == ','.join(creators), Contest.title == title, Contest.description == description, Contest.tasks == ','.join(tasks), Contest.start_time == start_time, Contest.end_time == end_time).first().id}
+            return {'status': 'ok', 'id': contest.id}
         except AssertionError as ex:
             return {'status': ex.args[0]}
 
     def __repr__(self):
-        return f"Contest(title='{self.title}', tasks='{self.tasks}')"
+        return f"Contest(id={self.id}, title='{self.title}')"
+
+
+class ContestTask(SqlAlchemyBase):
+    __tablename__ = 'contest_tasks'
+
+    contest_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("contests.id"), primary_key=True)
+    position = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)  # place of the task in the contest from 0
+    task_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tasks.id"), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"ContestTask(contest_id={self.contest_id}, position={self.position}, task_id={self.task_id})"
+
+
+class ContestCreator(SqlAlchemyBase):
+    __tablename__ = 'contest_creators'
+
+    contest_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("contests.id"), primary_key=True)
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), primary_key=True, index=True)
+
+    def __repr__(self):
+        return f"ContestCreator(contest_id={self.contest_id}, user_id={self.user_id})"
 
 
 class User(SqlAlchemyBase, UserMixin):
@@ -491,15 +695,15 @@ class User(SqlAlchemyBase, UserMixin):
         return session.query(User).filter(User.username.like(_like(username))).all()
 
     @staticmethod
-    def get_user(user_id: int):
+    def get_user(user_id: int, session=None):
         """Return User(**kwargs) by user_id or None if id is invalid"""
-        session = create_session()
+        session = create_session() if session is None else session
         return session.query(User).filter(User.id == user_id, User.registered == True).first()
 
     @staticmethod
-    def get_api(api_key: str):
+    def get_api(api_key: str, session=None):
         """Return user by api_key"""
-        session = create_session()
+        session = create_session() if session is None else session
         return session.query(User).filter(User.api_key == api_key, User.registered == True).first()
 
     @staticmethod
@@ -552,40 +756,144 @@ class User(SqlAlchemyBase, UserMixin):
 
 class Attempt(SqlAlchemyBase):
     __tablename__ = 'attempts'
+    __table_args__ = (sqlalchemy.Index('ix_attempts_contest_task_user', 'contest_id', 'task_id', 'user_id'),)
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     contest_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("contests.id"), nullable=False)
     task_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tasks.id"), nullable=False)
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), nullable=False)
-    solution = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    solution_hash = sqlalchemy.Column(sqlalchemy.String, sqlalchemy.ForeignKey("sources.hash"), nullable=True, index=True)  # text is kept in sources
     time = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
     score = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)
     status = sqlalchemy.Column(sqlalchemy.String, nullable=True)
-
-    def change_data(self, score=None, status=None):
+    checked_hash = sqlalchemy.Column(sqlalchemy.String, nullable=True)  # Checker.attempt_hash() of the last check
+    wait_time = sqlalchemy.Column(sqlalchemy.Float, nullable=True)  # seconds in the queue table before judge_worker.py took it (JUDGE_DATABASE_QUEUE)
+
+    @property
+    def solution(self) -> str:
+        """Source of the attempt, loaded from sources on first use"""
+        if getattr(self, '_solution', None) is None:
+            self._solution = Source.get_source(self.solution_hash)
+        return self._solution
+
+    @solution.setter
+    def solution(self, solution: str):
+        self.solution_hash = Source.add_source(solution)
+        self._solution = solution
+
+    def change_data(self, score=None, status=None, checked_hash=None):
         """
-        Change score/status, return
+        Change score/status/checked_hash, return
         {'status': 'ok'}
-        {'status': 'invalid <score/status> type, expected <str/int> or None'}
+        {'status': 'invalid <score/status/checked_hash> type, expected <str/int> or None'}
         """
         try:
             session = create_session()
             assert score is None or type(score) == int, 'invalid score type, expected int or None'
             assert status is None or type(status) == str, 'invalid status type, expected str or None'
+            assert checked_hash is None or type(checked_hash) == str, 'invalid checked_hash type, expected str or None'
             attempt = session.query(Attempt).filter(Attempt.id == self.id).first()
             if score is not None:
                 self.score = attempt.score = score
             if status is not None:
                 self.status = attempt.status = status
+            if checked_hash is not None:
+                self.checked_hash = attempt.checked_hash = checked_hash
             session.commit()
             return {'status': 'ok'}
         except AssertionError as ex:
             return {'status': ex.args[0]}
 
+    def save_result(self, status: str, score: int, trials: list, checked_hash=None, stale=(), job=None) -> bool:
+        """
+        Save result of the check in one transaction: delete stale trials by ids, add trials [{'test_id': int, 'status': str, ...}, ...]
+        (see Trial.add_trial()), change status/score of the attempt and counters of the task, attempt is counted once,
+        successful is changed on recheck only if OK status changed, nothing is saved if the job (Job) was taken by other worker, return whether saved
+        """
+        session = create_session()
+        if job is not None and not job.hold(session):
+            session.rollback()
+            return False
+        if stale:
+            session.query(Trial).filter(Trial.id.in_(stale)).delete(synchronize_session='fetch')  # removed from the thread session too, ids can be reused by new trials
+        session.add_all([Trial(attempt_id=self.id, **trial) for trial in trials])
+        attempt = session.query(Attempt).filter(Attempt.id == self.id).first()
+        previous = attempt.status  # '?' if attempt is not counted yet
+        self.status = attempt.status = status
+        self.score = attempt.score = score
+        if checked_hash is not None:
+            self.checked_hash = attempt.checked_hash = checked_hash
+        if previous == '?':
+            counters = {Task.attempts: Task.attempts + 1, Task.successful: Task.successful + (status == 'OK')}
+        elif (status == 'OK') != (previous == 'OK'):
+            counters = {Task.successful: Task.successful + (1 if status == 'OK' else -1)}
+        else:
+            counters = {}
+        if counters:  # counters are changed by the database, so parallel checks do not lose updates
+            session.query(Task).filter(Task.id == self.task_id).update(counters, synchronize_session=False)
+        Standing.update(session, attempt)
+        session.commit()
+        return True
+
     def retry(self):
-        """Retry attempt and change values if something changed"""
-        thread = threading.Thread(target=Checker.check_attempt, args=(self.id,))
-        thread.start()
+        """
+        Retry attempt and change values if something changed, return
+        {'status': 'ok'}
+        {'status': 'judge queue is full'}
+        """
+        if Job.full() if Judge.database_queue else judge.full():
+            return {'status': 'judge queue is full'}
+        Trial.delete_attempt_trials(self.id)  # every test is run again
+        return {'status': 'ok'} if _submit(self.id, Judge.REJUDGE, self.user_id) else {'status': 'judge queue is full'}
+
+    @staticmethod
+    def rejudge(condition, force=False) -> dict:
+        """
+        Recheck checked attempts matching sqlalchemy condition in background (Judge.BATCH), attempts checked on the same
+        solution, tests and limits are skipped, with force every test is run again (cached verdicts of the tasks are dropped), return
+        {'status': 'ok', 'queued': int, 'skipped': int}
+        """
+        session = create_session()
+        queued, skipped = [], 0
+        for task_id, attempts in Attempt.__by_task(session.query(Attempt).filter(condition, Attempt.status != '?').all()):
+            task = Task.get_task(task_id)
+            tests = task.get_tests()
+            for attempt in attempts:
+                if force or attempt.checked_hash != Checker.attempt_hash(attempt.solution_hash, task, tests):
+                    queued.append(attempt)
+                else:
+                    skipped += 1
+        if force and queued:
+            ids = [attempt.id for attempt in queued]
+            session.query(Trial).filter(Trial.attempt_id.in_(ids)).delete(synchronize_session=False)
+            session.query(Attempt).filter(Attempt.id.in_(ids)).update({Attempt.checked_hash: None}, synchronize_session=False)
+            session.query(Verdict).filter(Verdict.task_id.in_({attempt.task_id for attempt in queued})).delete(synchronize_session=False)  # otherwise attempts without trials take it
+            session.commit()
+        if Judge.database_queue:
+            Job.add_batch([(attempt.id, attempt.user_id) for attempt in queued])
+        else:
+            judge.submit_batch([(attempt.id, attempt.user_id) for attempt in queued])
+        return {'status': 'ok', 'queued': len(queued), 'skipped': skipped}
+
+    @staticmethod
+    def get_rejudge_progress(condition) -> dict:
+        """Return {'total': int, 'done': int} of checked attempts matching sqlalchemy condition, done are checked on current tests and limits"""
+        session = create_session()
+        total, done = 0, 0
+        for task_id, attempts in Attempt.__by_task(session.query(Attempt).filter(condition, Attempt.status != '?').all()):
+            task = Task.get_task(task_id)
+            tests = task.get_tests()
+            total += len(attempts)
+            done += sum(1 for attempt in attempts if attempt.checked_hash == Checker.attempt_hash(attempt.solution_hash, task, tests))
+        return {'total': total, 'done': done}
+
+    @staticmethod
+    def __by_task(attempts: list) -> list:
+        """Return [(task_id, [Attempt(**kwargs), ...]), ...]"""
+        tasks = {}
+        for attempt in attempts:
+            tasks.setdefault(attempt.task_id, []).append(attempt)
+        return list(tasks.items())
 
     def get_tests_statuses(self):
         """Return [Trial(**kwargs) by attempt_id]"""
@@ -593,16 +901,31 @@ class Attempt(SqlAlchemyBase):
         return session.query(Trial).filter(Trial.attempt_id == self.id).all()
 
     @staticmethod
-    def get_attempt(attempt_id: int):
+    def get_attempt(attempt_id: int, session=None):
         """Return Attempt(**kwargs) by attempt_id or None if id is invalid"""
-        session = create_session()
+        session = create_session() if session is None else session
         return session.query(Attempt).filter(Attempt.id == attempt_id).first()
 
     @staticmethod
-    def get_attempts(contest_id: int, task_id: int, user_id: int):
-        """Return [Attempt(**kwargs), ...] by contest_id, task_id, user_id"""
+    def get_attempts(contest_id: int, task_id: int, user_id: int, solutions=False):
+        """Return [Attempt(**kwargs), ...] by contest_id, task_id, user_id, with solutions their sources are loaded in one more query"""
         session = create_session()
-        return session.query(Attempt).filter(Attempt.contest_id == contest_id, Attempt.task_id == task_id, Attempt.user_id == user_id).all()
+        attempts = session.query(Attempt).filter(Attempt.contest_id == contest_id, Attempt.task_id == task_id, Attempt.user_id == user_id).all()
+        if solutions:
+            Attempt.load_solutions(attempts, session)
+        return attempts
+
+    @staticmethod
+    def load_solutions(attempts: list, session=None):
+        """Load sources of the attempts in one query, so Attempt.solution doesn't query them one by one"""
+        hashes = {attempt.solution_hash for attempt in attempts if getattr(attempt, '_solution', None) is None}
+        if not hashes:
+            return
+        session = create_session() if session is None else session
+        sources = {key: decompress(data).decode('UTF-8') for key, data in session.query(Source.hash, Source.data).filter(Source.hash.in_(hashes))}
+        for attempt in attempts:
+            if getattr(attempt, '_solution', None) is None:
+                attempt._solution = sources.get(attempt.solution_hash)
 
     @staticmethod
     def get_tasks_sum(contest_id, user_id: int):
@@ -621,13 +944,39 @@ class Attempt(SqlAlchemyBase):
         return session.query(Attempt, sqlalchemy.func.max(Attempt.score)).filter(Attempt.contest_id == contest_id, Attempt.task_id == task_id, Attempt.user_id == user_id).first()[0]
 
     @staticmethod
-    def add_attempt(contest_id: int, task_id: int, user_id: int, solution: str):
+    def get_best_results(contest_id: int, task_ids: list, user_id: int) -> dict:
+        """Return {task_id: Attempt(**kwargs) with the biggest score, ...} for tasks with attempts in one query, same as Attempt.get_best_result()"""
+        return Attempt.__get_results(contest_id, task_ids, user_id, sqlalchemy.func.coalesce(Attempt.score, -1), Attempt.id)
+
+    @staticmethod
+    def get_last_results(contest_id: int, task_ids: list, user_id: int) -> dict:
+        """Return {task_id: last Attempt(**kwargs), ...} for tasks with attempts in one query, same as Attempt.get_last_result()"""
+        return Attempt.__get_results(contest_id, task_ids, user_id, Attempt.time, sqlalchemy.desc(Attempt.id))
+
+    @staticmethod
+    def __get_results(contest_id: int, task_ids: list, user_id: int, value, order) -> dict:
+        """Return {task_id: Attempt(**kwargs) with the biggest value, ...}, attempts with the same value are taken by order"""
+        if not task_ids:
+            return {}
+        session = create_session()
+        condition = (Attempt.contest_id == contest_id, Attempt.user_id == user_id, Attempt.task_id.in_(task_ids))
+        best = session.query(Attempt.task_id.label('task_id'), sqlalchemy.func.max(value).label('value')).filter(*condition).group_by(Attempt.task_id).subquery()
+        results = {}
+        for attempt in session.query(Attempt).join(best, sqlalchemy.and_(Attempt.task_id == best.c.task_id, value == best.c.value)).filter(*condition).order_by(order):
+            results.setdefault(attempt.task_id, attempt)
+        return results
+
+    @staticmethod
+    def add_attempt(contest_id: int, task_id: int, user_id: int, solution: str, priority=None):
         """
-        Add attempt to database, return:
+        Add attempt to database and put it into the judge queue with priority class
+        (by default Judge.CONTEST if the contest is running, Judge.PRACTICE otherwise), return:
         {'status': 'ok', 'id': int}
         {'status': 'invalid <contest_id/task_id/user_id/solution> type, expected <str/int>'}
         {'status': 'no <contest/task/user> with id '<id>''}
         {'status': 'the same solution has already been sent'}
+        {'status': 'judge queue is full'}
+        {'status': 'too many attempts of the user in the judge queue'}
         """
         try:
             session = create_session()
@@ -635,10 +984,15 @@ class Attempt(SqlAlchemyBase):
             assert type(task_id) == int, 'invalid task_id type, expected int'
             assert type(user_id) == int, 'invalid user_id type, expected int'
             assert type(solution) == str, 'invalid solution type, expected str'
-            assert Contest.get_contest(contest_id) is not None, f"no contest with id '{contest_id}'"
+            contest = Contest.get_contest(contest_id)
+            assert contest is not None, f"no contest with id '{contest_id}'"
             assert Task.get_task(task_id) is not None, f"no task with id '{task_id}'"
             assert User.get_user(user_id) is not None, f"no user with id '{user_id}'"
-            assert len(session.query(Attempt).filter(Attempt.contest_id == contest_id, Attempt.task_id == task_id, Attempt.user_id == user_id, Attempt.solution == solution).all()) == 0, 'the same solution has already been sent'
+            assert len(session.query(Attempt).filter(Attempt.contest_id == contest_id, Attempt.task_id == task_id, Attempt.user_id == user_id, Attempt.solution_hash == Source.hash_source(solution)).all()) == 0, 'the same solution has already been sent'
+            if priority is None:
+                priority = Judge.CONTEST if contest_id != 0 and (contest.start_time or 0) <= time() <= (contest.end_time or pow(2, 34)) else Judge.PRACTICE
+            assert not (Job.full() if Judge.database_queue else judge.full()), 'judge queue is full'
+            assert priority not in Judge.limited or not (Job.user_full(user_id) if Judge.database_queue else judge.user_full(user_id)), 'too many attempts of the user in the judge queue'
             session.add(Attempt(contest_id=contest_id,
                                 task_id=task_id,
                                 user_id=user_id,
@@ -646,9 +1000,12 @@ class Attempt(SqlAlchemyBase):
                                 status='?',
                                 time=int(time())))
             session.commit()
-            attempt_id = session.query(Attempt).filter(Attempt.contest_id == contest_id, Attempt.task_id == task_id, Attempt.user_id == user_id, Attempt.solution == solution).first().id
-            thread = threading.Thread(target=Checker.check_attempt, args=(attempt_id,))
-            thread.start()
+            attempt_id = session.query(Attempt).filter(Attempt.contest_id == contest_id, Attempt.task_id == task_id, Attempt.user_id == user_id, Attempt.solution_hash == Source.hash_source(solution)).first().id
+            if not _submit(attempt_id, priority, user_id):  # queue was filled after the check above
+                session.query(Attempt).filter(Attempt.id == attempt_id).delete(synchronize_session=False)
+                session.commit()
+                full = priority in Judge.limited and (Job.user_full(user_id) if Judge.database_queue else judge.user_full(user_id))
+                return {'status': 'too many attempts of the user in the judge queue' if full else 'judge queue is full'}
             return {'status': 'ok', 'id': attempt_id}
         except AssertionError as ex:
             return {'status': ex.args[0]}
@@ -657,21 +1014,90 @@ class Attempt(SqlAlchemyBase):
         return f"Attempt(score={self.score}, status='{self.status}')"
 
 
+class Source(SqlAlchemyBase):
+    __tablename__ = 'sources'
+
+    hash = sqlalchemy.Column(sqlalchemy.String, primary_key=True)  # Source.hash_source() of the text
+    data = sqlalchemy.Column(sqlalchemy.LargeBinary, nullable=False)  # zlib compressed text
+
+    @staticmethod
+    def hash_source(solution: str) -> str:
+        """Return hash the solution is saved by"""
+        return sha256(solution.encode('UTF-8')).hexdigest()
+
+    @staticmethod
+    def add_source(solution: str) -> str:
+        """Save solution if the same text is not saved yet, return its hash"""
+        session = create_session()
+        key = Source.hash_source(solution)
+        if session.query(Source.hash).filter(Source.hash == key).first() is None:
+            try:
+                with session.begin_nested():  # savepoint, rollback keeps objects the caller added to the session
+                    session.add(Source(hash=key, data=compress(solution.encode('UTF-8'))))
+            except sqlalchemy.exc.IntegrityError:
+                pass  # saved by other thread at the same time
+        return key
+
+    @staticmethod
+    def get_source(key: str, session=None):
+        """Return text of the solution by hash or None if there is no such solution"""
+        session = create_session() if session is None else session
+        source = session.query(Source).filter(Source.hash == key).first()
+        return decompress(source.data).decode('UTF-8') if source is not None else None
+
+    def __repr__(self):
+        return f"Source(hash='{self.hash}')"
+
+
 class Trial(SqlAlchemyBase):
     __tablename__ = 'trial'
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    attempt_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("attempts.id"), nullable=False)
+    attempt_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("attempts.id"), nullable=False, index=True)
     test_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tests.id"), nullable=False)
     status = sqlalchemy.Column(sqlalchemy.String, nullable=False)
-    output = sqlalchemy.Column(sqlalchemy.String, nullable=True)
+    output_data = deferred(sqlalchemy.Column(sqlalchemy.LargeBinary, nullable=True))  # zlib compressed beginning of the wrong answer, loaded on use
+    mismatch = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)  # byte of the output where it first differs from the expected one
+    test_hash = sqlalchemy.Column(sqlalchemy.String, nullable=True)  # Test.get_hash() when trial was run
+    time = sqlalchemy.Column(sqlalchemy.Float, nullable=True)  # wall time, seconds
+    cpu_time = sqlalchemy.Column(sqlalchemy.Float, nullable=True)  # user + system time, seconds
+    memory = sqlalchemy.Column(sqlalchemy.Integer, nullable=True)  # peak memory, KB
+
+    @property
+    def output(self):
+        """Beginning of the wrong answer (Checker.report_limit bytes) or None"""
+        return decompress(self.output_data).decode('UTF-8') if self.output_data is not None else None
+
+    @output.setter
+    def output(self, output):
+        self.output_data = Trial.pack(output)
+
+    def get_mismatch_place(self):
+        """Return (line, column) of the first difference counted from 1 or None if it is not in the kept beginning of the output"""
+        data = (self.output or '').encode('UTF-8')
+        if self.mismatch is None or self.mismatch > len(data):
+            return None
+        before = data[:self.mismatch].decode('UTF-8', errors='replace')
+        return before.count('\n') + 1, len(before) - before.rfind('\n')
 
     @staticmethod
-    def get_attempt_trials(attempt_id: int):
+    def pack(output):
+        """Return compressed output or None"""
+        return compress(output.encode('UTF-8')) if output is not None else None
+
+    @staticmethod
+    def get_attempt_trials(attempt_id: int, session=None):
         """Return [Trial(**kwargs), ...] by attempt id"""
-        session = create_session()
+        session = create_session() if session is None else session
         return session.query(Trial).filter(Trial.attempt_id == attempt_id).all()
 
+    @staticmethod
+    def delete_attempt_trials(attempt_id: int):
+        """Delete all trials of the attempt"""
+        session = create_session()
+        session.query(Trial).filter(Trial.attempt_id == attempt_id).delete(synchronize_session=False)
+        session.commit()
+
     @staticmethod
     def get_trial(trial_id: int):
         """Return Trial(**kwargs) by trial_id or None if id is invalid"""
@@ -679,11 +1105,11 @@ class Trial(SqlAlchemyBase):
         return session.query(Trial).filter(Trial.id == trial_id).first()
 
     @staticmethod
-    def add_trial(attempt_id: int, test_id: int, status: str, output=None):
+    def add_trial(attempt_id: int, test_id: int, status: str, output=None, time=None, cpu_time=None, memory=None, test_hash=None, mismatch=None):
         """
-        Add attempt_id, test_id, status, output to database, return:
+        Add attempt_id, test_id, status, output, time, cpu_time, memory, test_hash, mismatch to database, return:
         {'status': 'ok', 'id': int}
-        {'status': 'invalid <attempt_id/tesk_id/status/output> type, expected <str/int/None>'}
+        {'status': 'invalid <attempt_id/tesk_id/status/output/time/cpu_time/memory/test_hash/mismatch> type, expected <str/int/float/None>'}
         {'status': 'no <attempt/test> with id '<id>''}
         {'status': 'same trial has already been added'}
         """
@@ -693,17 +1119,287 @@ class Trial(SqlAlchemyBase):
             assert type(test_id) == int, 'invalid test_id type, expected int'
             assert type(status) == str, 'invalid status type, expected int'
             assert output is None or type(output) == str, 'invalid output type, expected str or None'
+            assert time is None or type(time) == float, 'invalid time type, expected float or None'
+            assert cpu_time is None or type(cpu_time) == float, 'invalid cpu_time type, expected float or None'
+            assert memory is None or type(memory) == int, 'invalid memory type, expected int or None'
+            assert test_hash is None or type(test_hash) == str, 'invalid test_hash type, expected str or None'
+            assert mismatch is None or type(mismatch) == int, 'invalid mismatch type, expected int or None'
             assert Attempt.get_attempt(attempt_id) is not None, f"no attempt with id '{attempt_id}'"
             assert Test.get_test(test_id) is not None, f"no test with id '{test_id}'"
-            assert len(session.query(Trial).filter(Trial.attempt_id == attempt_id, Trial.test_id == test_id, Trial.status == status, Trial.output == output).all()) == 0, 'same trial has already been added'
+            assert len(session.query(Trial).filter(Trial.attempt_id == attempt_id, Trial.test_id == test_id, Trial.status == status, Trial.output_data == Trial.pack(output)).all()) == 0, 'same trial has already been added'
             session.add(Trial(attempt_id=attempt_id,
                               test_id=test_id,
                               status=status,
-                              output=output))
+                              output=output,
+                              time=time,
+                              cpu_time=cpu_time,
+                              memory=memory,
+                              test_hash=test_hash,
+                              mismatch=mismatch))
             session.commit()
-            return {'status': 'ok', 'id': session.query(Trial).filter(Trial.attempt_id == attempt_id, Trial.test_id == test_id, Trial.status == status, Trial.output == output).first().id}
+            return {'status': 'ok', 'id': session.query(Trial).filter(Trial.attempt_id == attempt_id, Trial.test_id == test_id, Trial.status == status, Trial.output_data == Trial.pack(output)).first().id}
         except AssertionError as ex:
             return {'status': ex.args[0]}
 
     def __repr__(self):
-        return f"Trial(output='{self.output}', status='{self.status}')"
+        return f"Trial(status='{self.status}', mismatch={self.mismatch})"
+
+
+class Job(SqlAlchemyBase):
+    __tablename__ = 'judge_jobs'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    attempt_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("attempts.id"), nullable=False, unique=True)
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), nullable=True)
+    priority = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)  # Judge.CONTEST/PRACTICE/REJUDGE
+    submitted = sqlalchemy.Column(sqlalchemy.Float, nullable=False)
+    owner = sqlalchemy.Column(sqlalchemy.String, nullable=True)  # worker that checks the attempt
+    lease_until = sqlalchemy.Column(sqlalchemy.Float, nullable=True)  # job can be taken by other worker after that
+    tries = sqlalchemy.Column(sqlalchemy.Integer, default=0)
+
+    @staticmethod
+    def add_job(attempt_id: int, priority: int, user_id=None) -> bool:
+        """Put attempt into the queue table, return False if queue is full or user has Judge.user_limit attempts of Judge.limited classes in it"""
+        session = create_session()
+        if session.query(Job).filter(Job.priority != Judge.BATCH).count() >= Judge.queue_size:
+            return False
+        if priority in Judge.limited and session.query(Job).filter(Job.user_id == user_id, Job.priority.in_(Judge.limited)).count() >= Judge.user_limit:
+            return False
+        job = session.query(Job).filter(Job.attempt_id == attempt_id).first()
+        if job is not None:
+            job.priority = min(job.priority, priority)
+        else:
+            session.add(Job(attempt_id=attempt_id, user_id=user_id, priority=priority, submitted=time(), tries=0))
+        try:
+            session.commit()
+        except sqlalchemy.exc.IntegrityError:
+            session.rollback()  # added by Job.restore() or other thread at the same time, so it is queued
+        return True
+
+    @staticmethod
+    def add_batch(attempts: list):
+        """Same as judge.submit_batch() for the queue table"""
+        session = create_session()
+        queued = set(attempt_id for attempt_id, in session.query(Job.attempt_id))
+        Job.__add_all(session, [Job(attempt_id=attempt_id, user_id=user_id, priority=Judge.BATCH, submitted=time(), tries=0) for attempt_id, user_id in attempts if attempt_id not in queued])
+
+    @staticmethod
+    def __add_all(session, jobs: list) -> int:
+        """Add jobs, the ones with attempts queued at the same time by other thread or process are skipped, return how many were added"""
+        session.add_all(jobs)
+        try:
+            session.commit()
+            return len(jobs)
+        except sqlalchemy.exc.IntegrityError:
+            session.rollback()
+        added = 0
+        for job in jobs:  # one by one to find the queued ones
+            session.add(job)
+            try:
+                session.commit()
+                added += 1
+            except sqlalchemy.exc.IntegrityError:
+                session.rollback()
+        return added
+
+    @staticmethod
+    def full() -> bool:
+        """Same as judge.full() for the queue table"""
+        session = create_session()
+        return session.query(Job).filter(Job.priority != Judge.BATCH).count() >= Judge.queue_size
+
+    @staticmethod
+    def user_full(user_id: int) -> bool:
+        """Same as judge.user_full() for the queue table"""
+        session = create_session()
+        return session.query(Job).filter(Job.user_id == user_id, Job.priority.in_(Judge.limited)).count() >= Judge.user_limit
+
+    @staticmethod
+    def claim(owner: str, lease: float):
+        """
+        Take the job the same way as judge does (see judge.py -> Judge -> __take()) for lease seconds,
+        jobs with expired lease are taken again (trials written before are reused by Checker.check_attempt),
+        return Job(**kwargs) or None if there are no free jobs
+        """
+        session = create_session()
+        for _ in range(10):  # other workers can take the same job at the same time
+            now = time()
+            free = sqlalchemy.or_(Job.owner.is_(None), Job.lease_until < now)
+            Job.__give_up(session, free)
+            jobs = session.query(Job).filter(free, Job.priority != Judge.BATCH).all()
+            if not jobs and session.query(Job).filter(Job.priority == Judge.BATCH, Job.owner.isnot(None), Job.lease_until >= now).count() < Judge.batch_limit:
+                jobs = session.query(Job).filter(free, Job.priority == Judge.BATCH).order_by(Job.id).limit(1).all()
+            if not jobs:
+                return None
+            running = dict(session.query(Job.user_id, sqlalchemy.func.count(Job.id)).filter(Job.owner.isnot(None), Job.lease_until >= now).group_by(Job.user_id).all())
+            job = min(jobs, key=lambda job: (max(0, job.priority - int((now - job.submitted) // Judge.aging)), running.get(job.user_id, 0), job.submitted))
+            taken = session.query(Job).filter(Job.id == job.id, free).update({Job.owner: owner, Job.lease_until: now + lease, Job.tries: Job.tries + 1}, synchronize_session=False)
+            if taken:  # kept after the job is deleted, the same as judge.get_wait_time()
+                session.query(Attempt).filter(Attempt.id == job.attempt_id).update({Attempt.wait_time: now - job.submitted}, synchronize_session=False)
+            session.commit()
+            if taken:
+                job = session.query(Job).filter(Job.id == job.id).first()
+                session.expunge(job)  # read by the renewal thread while the session of the worker is used for the check
+                return job
+        return None
+
+    @staticmethod
+    def __give_up(session, free):
+        """Delete free jobs taken Judge.max_tries times (their attempts crash or hang the worker), their attempts get JE status"""
+        for job in session.query(Job).filter(free, Job.tries >= Judge.max_tries).all():
+            if session.query(Job).filter(Job.id == job.id, free).delete(synchronize_session=False):
+                attempt = session.query(Attempt).filter(Attempt.id == job.attempt_id).first()
+                if attempt is not None:
+                    attempt.save_result('JE', 0, [])  # commits deletion of the job too
+                else:
+                    session.commit()
+            else:
+                session.rollback()
+
+    def hold(self, session) -> bool:
+        """Lock the job in the transaction of the session, return False if it was taken by other worker"""
+        return bool(session.query(Job).filter(Job.id == self.id, Job.owner == self.owner).update({Job.owner: self.owner}, synchronize_session=False))
+
+    def renew(self, lease: float) -> bool:
+        """Extend lease of the job for lease seconds, return False if job was taken by other worker"""
+        session = create_session()
+        renewed = session.query(Job).filter(Job.id == self.id, Job.owner == self.owner).update({Job.lease_until: time() + lease}, synchronize_session=False)
+        session.commit()
+        return bool(renewed)
+
+    def finish(self):
+        """Delete checked job from the queue table"""
+        session = create_session()
+        session.query(Job).filter(Job.id == self.id, Job.owner == self.owner).delete(synchronize_session=False)
+        session.commit()
+
+    @staticmethod
+    def restore() -> int:
+        """Add jobs for attempts left in progress without a job (checked by a stopped web server), return their number"""
+        session = create_session()
+        attempts = session.query(Attempt).filter(Attempt.status == '?', ~Attempt.id.in_(session.query(Job.attempt_id))).all()
+        return Job.__add_all(session, [Job(attempt_id=attempt.id, user_id=attempt.user_id, priority=Judge.REJUDGE, submitted=time(), tries=0) for attempt in attempts])
+
+    @staticmethod
+    def get_stats() -> dict:
+        """Same as judge.get_stats() for the queue table, workers are processes checking attempts, average_wait is for jobs in the table"""
+        session = create_session()
+        now = time()
+        jobs = session.query(Job).all()
+        busy = [job for job in jobs if job.owner is not None and job.lease_until >= now]
+        return {'workers': len({job.owner.rsplit(':', 1)[0] for job in busy}),
+                'busy': len(busy),
+                'queue_size': len(jobs) - len(busy),
+                'queue_limit': Judge.queue_size,
+                'average_wait': sum(now - job.submitted for job in jobs) / len(jobs) if jobs else 0.0,
+                'classes': {name: sum(1 for job in jobs if job.priority == priority and job not in busy) for priority, name in Judge.classes.items()},
+                'users': len({job.user_id for job in jobs})}
+
+    def __repr__(self):
+        return f"Job(attempt_id={self.attempt_id}, owner='{self.owner}')"
+
+
+class Standing(SqlAlchemyBase):
+    __tablename__ = 'standings'
+    __table_args__ = (sqlalchemy.UniqueConstraint('contest_id', 'user_id', 'task_id'),)
+    TOTAL = 0  # task_id of the row with the sum of best scores on tasks of the contest
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    contest_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("contests.id"), nullable=False)
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"), nullable=False)
+    task_id = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)  # Standing.TOTAL or id of the task
+    score = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)  # best score of the checked attempts sent in time
+
+    @staticmethod
+    def update(session, attempt):
+        """Recount best score of the attempt's user on its task and the total in the session of the check, contest 0 has no standings"""
+        contest = session.query(Contest).filter(Contest.id == attempt.contest_id).first()
+        if contest is None or contest.id == 0 or not (contest.start_time or 0) <= attempt.time <= (contest.end_time or pow(2, 34)):
+            return
+        best = session.query(sqlalchemy.func.max(Attempt.score)).filter(Attempt.contest_id == contest.id, Attempt.task_id == attempt.task_id, Attempt.user_id == attempt.user_id, Attempt.status != '?',
+                                                                        Attempt.time >= (contest.start_time or 0), Attempt.time <= (contest.end_time or pow(2, 34))).scalar()
+        Standing.__set(session, contest.id, attempt.user_id, attempt.task_id, best or 0)
+        total = session.query(sqlalchemy.func.sum(Standing.score)).filter(Standing.contest_id == contest.id, Standing.user_id == attempt.user_id, Standing.task_id.in_(contest.get_task_ids(session))).scalar()
+        Standing.__set(session, contest.id, attempt.user_id, Standing.TOTAL, total or 0)
+
+    @staticmethod
+    def __set(session, contest_id: int, user_id: int, task_id: int, score: int):
+        """Write score of the row, the row inserted by other check of the user at the same time is updated instead"""
+        condition = (Standing.contest_id == contest_id, Standing.user_id == user_id, Standing.task_id == task_id)
+        standing = session.query(Standing).filter(*condition).first()
+        if standing is None:
+            try:
+                with session.begin_nested():  # savepoint, failed insert doesn't roll back the result of the check
+                    session.add(Standing(contest_id=contest_id, user_id=user_id, task_id=task_id, score=score))
+                return
+            except sqlalchemy.exc.IntegrityError:
+                standing = session.query(Standing).filter(*condition).one()
+        standing.score = score
+        session.flush()
+
+    @staticmethod
+    def rebuild(contest_id=None) -> int:
+        """Recreate standings of the contest (of every contest if None) from checked attempts, return number of rows"""
+        session = create_session()
+        contests = session.query(Contest).filter(Contest.id != 0, *([Contest.id == contest_id] if contest_id is not None else [])).all()
+        for contest in contests:
+            session.query(Standing).filter(Standing.contest_id == contest.id).delete(synchronize_session=False)
+            task_ids = set(contest.get_task_ids(session))
+            totals = {}
+            for user_id, task_id, score in session.query(Attempt.user_id, Attempt.task_id, sqlalchemy.func.max(Attempt.score)).filter(
+                    Attempt.contest_id == contest.id, Attempt.status != '?', Attempt.time >= (contest.start_time or 0), Attempt.time <= (contest.end_time or pow(2, 34))).group_by(Attempt.user_id, Attempt.task_id):
+                session.add(Standing(contest_id=contest.id, user_id=user_id, task_id=task_id, score=score or 0))
+                totals[user_id] = totals.get(user_id, 0) + ((score or 0) if task_id in task_ids else 0)
+            session.add_all([Standing(contest_id=contest.id, user_id=user_id, task_id=Standing.TOTAL, score=total) for user_id, total in totals.items()])
+        session.commit()
+        return session.query(Standing).filter(*([Standing.contest_id == contest_id] if contest_id is not None else [])).count()
+
+    def __repr__(self):
+        return f"Standing(contest_id={self.contest_id}, user_id={self.user_id}, task_id={self.task_id}, score={self.score})"
+
+
+class Verdict(SqlAlchemyBase):
+    __tablename__ = 'verdicts'
+    __table_args__ = (sqlalchemy.Index('ix_verdicts_task_solution', 'task_id', 'solution_hash'),)
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    task_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("tasks.id"), nullable=False)
+    solution_hash = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    tests_hash = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    time_limit = sqlalchemy.Column(sqlalchemy.Float, nullable=False)
+    status = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    score = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    trials = sqlalchemy.Column(sqlalchemy.String, nullable=False)  # json [{'test_id': int, 'status': str, ...}, ...]
+
+    def get_trials(self):
+        """Return [{'test_id': int, 'status': str, 'output': str or None, 'mismatch': int or None, ...}, ...] (see Trial.add_trial)"""
+        return [trial if type(trial) == dict else dict(zip(('test_id', 'status', 'output'), trial)) for trial in loads(self.trials)]
+
+    @staticmethod
+    def get_verdict(task_id: int, solution_hash: str, tests_hash: str, time_limit: float, session=None):
+        """Return Verdict(**kwargs) of the same solution on the same tests or None"""
+        session = create_session() if session is None else session
+        return session.query(Verdict).filter(Verdict.task_id == task_id, Verdict.solution_hash == solution_hash, Verdict.tests_hash == tests_hash, Verdict.time_limit == time_limit).first()
+
+    @staticmethod
+    def add_verdict(task_id: int, solution_hash: str, tests_hash: str, time_limit: float, status: str, score: int, trials: list):
+        """Save status, score and [{'test_id': int, 'status': str, ...}, ...] of the solution"""
+        session = create_session()
+        session.add(Verdict(task_id=task_id,
+                            solution_hash=solution_hash,
+                            tests_hash=tests_hash,
+                            time_limit=time_limit,
+                            status=status,
+                            score=score,
+                            trials=dumps(trials)))
+        session.commit()
+
+    @staticmethod
+    def clear(task_id: int):
+        """Delete all verdicts of the task"""
+        session = create_session()
+        session.query(Verdict).filter(Verdict.task_id == task_id).delete()
+        session.commit()
+
+    def __repr__(self):
+        return f"Verdict(task_id={self.task_id}, status='{self.status}')"
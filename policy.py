@@ -0,0 +1,56 @@
+import ast
+import threading
+from hashlib import sha256
+from collections import OrderedDict
+from os import environ
+
+
+class Policy:
+    """Rules for the solution code, checked on the syntax tree once per source"""
+    NAMES = {'eval', 'exec', 'open', 'compile', '__import__', 'globals', 'locals', 'vars', 'breakpoint',
+             'getattr', 'setattr', 'delattr', '__builtins__', '__loader__', '__spec__'}  # forbidden identifiers
+    ATTRIBUTES = {'__builtins__', '__globals__', '__subclasses__', '__bases__', '__base__', '__mro__', '__class__',
+                  '__code__', '__dict__', '__loader__', '__import__', 'f_globals', 'f_locals', 'f_back', 'gi_frame'}  # forbidden attributes
+    cache_size = 10000  # how many verdicts are remembered
+
+    def __init__(self, names=None, attributes=None, allowed_imports=None):
+        self.names = set(Policy.NAMES if names is None else names)
+        self.attributes = set(Policy.ATTRIBUTES if attributes is None else attributes)
+        self.allowed_imports = set(allowed_imports or [])  # every other import is forbidden
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_environ():
+        """Return Policy() with modules from JUDGE_ALLOWED_IMPORTS (comma separated) allowed"""
+        return Policy(allowed_imports=[module.strip() for module in environ.get('JUDGE_ALLOWED_IMPORTS', '').split(',') if module.strip()])
+
+    def is_banned(self, solution: str) -> bool:
+        """Return True if solution breaks the rules, verdict is cached by solution hash"""
+        key = sha256(solution.encode('UTF-8')).hexdigest()
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        banned = self.__check(solution)
+        with self.lock:
+            self.cache[key] = banned
+            while len(self.cache) > Policy.cache_size:
+                self.cache.popitem(last=False)
+        return banned
+
+    def __check(self, solution: str) -> bool:
+        try:
+            tree = ast.parse(solution)
+        except SyntaxError:
+            return False  # compilation errors are found by Checker.compile
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import) and any(alias.name.split('.')[0] not in self.allowed_imports for alias in node.names):
+                return True
+            elif isinstance(node, ast.ImportFrom) and (node.level or node.module.split('.')[0] not in self.allowed_imports):
+                return True
+            elif isinstance(node, ast.Name) and node.id in self.names:
+                return True
+            elif isinstance(node, ast.Attribute) and node.attr in self.attributes:
+                return True
+        return False
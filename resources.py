@@ -1,6 +1,7 @@
 from flask import jsonify
-from flask_restful import Resource, reqparse, abort
-from models import User, Task, Contest, Attempt
+from flask_restful import Resource, reqparse, abort, inputs
+from models import User, Task, Contest, Attempt, Job
+from judge import Judge, judge
 from time import time
 
 
@@ -11,6 +12,26 @@ def get_user(api_key: str, is_creator=None) -> User:
     return user
 
 
+def get_rejudge_target(args):
+    """Return Task(**kwargs) or Contest(**kwargs) from args if user is its creator"""
+    user = get_user(args['api_key'], is_creator=True)
+    if args.get('task_id') is not None:
+        task = Task.get_task(args['task_id'])
+        if task is None:
+            abort(404, message=f'Invalid task_id: {args["task_id"]}')
+        if task.creator != user.id:
+            abort(403, message=f'You are not creator of the task')
+        return task
+    if args.get('contest_id') is not None:
+        contest = Contest.get_contest(args['contest_id'])
+        if contest is None:
+            abort(404, message=f'Invalid contest_id: {args["contest_id"]}')
+        if user.id not in contest.get_creator_ids():
+            abort(403, message=f'You are not creator of the contest')
+        return contest
+    abort(400, message='task_id or contest_id is required')
+
+
 class MeResource(Resource):
     def get(self):
         parser = reqparse.RequestParser()
@@ -45,6 +66,7 @@ class TasksResource(Resource):
         return jsonify([{'id': task.id,
                          'title': task.title,
                          'time_limit': task.time_limit,
+                         'memory_limit': task.memory_limit,
                          'creator': task.creator,
                          'attempts': task.attempts,
                          'successful': task.successful} for task in Task.get_all(args.get('sort_type', 'easy'))])
@@ -55,35 +77,38 @@ class ContestsResource(Resource):
         parser = reqparse.RequestParser()
         parser.add_argument('sort_type', required=False)
         args = parser.parse_args()
+        contests = Contest.get_all(args.get('sort_type', 'new'))
+        creators = Contest.get_creators_of([contest.id for contest in contests])
         return jsonify([{'id': contest.id,
                          'title': contest.title,
-                         'creators': contest.creators,
+                         'creators': ','.join(map(str, creators[contest.id])),
                          'start_time': contest.start_time,
-                         'end_time': contest.end_time} for contest in Contest.get_all(args.get('sort_type', 'new'))])
+                         'end_time': contest.end_time} for contest in contests])
 
 
 class ContestResource(Resource):
     def get(self, contest_id: int):
         parser = reqparse.RequestParser()
         parser.add_argument('api_key', required=True)
-        parser.add_argument('show_solution', type=bool, default=False)
+        parser.add_argument('show_solution', type=inputs.boolean, default=False)
         args = parser.parse_args()
         user = get_user(args['api_key'])
         contest = Contest.get_contest(contest_id)
         if contest is None:
             abort(404, message=f'Invalid contest_id: {contest_id}')
-        elif contest.start_time < time() and user not in contest.get_creators():
+        view = contest.get_view(user.id, solutions=args.get('show_solution', False))
+        if contest.start_time < time() and user not in view['creators']:
             abort(403, message='Contest not started yet')
         return jsonify({'title': contest.title,
-                        'creators': ','.join(user.username for user in contest.get_creators()),
+                        'creators': ','.join(user.username for user in view['creators']),
                         'description': contest.description,
                         'start_time': contest.start_time,
                         'end_time': contest.end_time,
                         'tasks': [{'id': task.id,
                                    'title': task.title,
-                                   'best_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(Attempt.get_best_result(contest.id, task.id, user.id)),
-                                   'last_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(Attempt.get_last_result(contest.id, task.id, user.id)),
-                                   } for task in contest.get_tasks()]})
+                                   'best_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(view['best'].get(task.id)),
+                                   'last_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(view['last'].get(task.id)),
+                                   } for task in view['tasks']]})
 
     def put(self, contest_id: int):
         parser = reqparse.RequestParser()
@@ -106,7 +131,7 @@ class ContestTaskResource(Resource):
     def get(self, contest_id: int, task_id: int):
         parser = reqparse.RequestParser()
         parser.add_argument('api_key', required=True)
-        parser.add_argument('show_solution', type=bool, default=False)
+        parser.add_argument('show_solution', type=inputs.boolean, default=False)
         args = parser.parse_args()
         user = get_user(args['api_key'])
         task = Task.get_task(task_id)
@@ -117,15 +142,17 @@ class ContestTaskResource(Resource):
             abort(404, message=f'Invalid contest_id: {contest_id}')
         elif contest.start_time < time():
             abort(403, message='Contest not started yet')
+        view = contest.get_view(user.id, [task_id], args.get('show_solution', False))
         return jsonify({'title': task.title,
                         'description': task.description,
-                        'tests': [{'input': test.input, 'output': test.output} for test in (task.get_tests() if user.id == task.creator else task.get_tests()[:2])],
+                        'tests': [{'input': test.input, 'output': test.output} for test in task.get_tests(None if user.id == task.creator else 2)],
                         'time_limit': task.time_limit,
+                        'memory_limit': task.memory_limit,
                         'creator': User.get_user(task.creator).username,
                         'attempts': {
-                            'best_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(Attempt.get_best_result(contest_id, task_id, user.id)),
-                            'last_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(Attempt.get_last_result(contest_id, task_id, user.id)),
-                            'all': [{'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} for attempt in Attempt.get_attempts(contest_id, task_id, user.id)]
+                            'best_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(view['best'].get(task_id)),
+                            'last_attempt': (lambda attempt: {'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} if attempt is not None else None)(view['last'].get(task_id)),
+                            'all': [{'id': attempt.id, 'score': attempt.score, 'status': attempt.status, 'time': attempt.time, 'solution': (attempt.solution if args.get('show_solution', False) else None)} for attempt in Attempt.get_attempts(contest_id, task_id, user.id, args.get('show_solution', False))]
                         },
                         'reference': task.reference if user.id == task.creator else None})
 
@@ -134,6 +161,7 @@ class AttemptResource(Resource):
     def get(self, attempt_id):
         parser = reqparse.RequestParser()
         parser.add_argument('api_key', required=True)
+        parser.add_argument('show_output', type=inputs.boolean, default=False)
         args = parser.parse_args()
         user = get_user(args['api_key'])
         attempt = Attempt.get_attempt(attempt_id)
@@ -145,4 +173,35 @@ class AttemptResource(Resource):
                         'status': attempt.status,
                         'time': attempt.time,
                         'solution': attempt.solution,
-                        'tests': [{'status': test.status} for test in attempt.get_tests_statuses()]})
+                        'wait_time': attempt.wait_time if Judge.database_queue else judge.get_wait_time(attempt.id),
+                        'tests': [{'status': test.status, 'time': test.time, 'cpu_time': test.cpu_time, 'memory': test.memory, 'mismatch': test.mismatch,
+                                   'output': (test.output if args.get('show_output', False) else None)} for test in attempt.get_tests_statuses()]})
+
+
+class JudgeResource(Resource):
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('api_key', required=True)
+        args = parser.parse_args()
+        get_user(args['api_key'])
+        return jsonify(Job.get_stats() if Judge.database_queue else judge.get_stats())
+
+
+class RejudgeResource(Resource):
+    def get(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('api_key', required=True)
+        parser.add_argument('task_id', type=int)
+        parser.add_argument('contest_id', type=int)
+        args = parser.parse_args()
+        return jsonify(get_rejudge_target(args).get_rejudge_progress())
+
+    def post(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('api_key', required=True)
+        parser.add_argument('task_id', type=int)
+        parser.add_argument('contest_id', type=int)
+        parser.add_argument('force', type=inputs.boolean, default=False)
+        args = parser.parse_args()
+        return jsonify(get_rejudge_target(args).rejudge(force=args.get('force', False)))
+
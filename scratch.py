@@ -0,0 +1,41 @@
+from os import environ, path, listdir, getpid, kill
+from shutil import rmtree
+from tempfile import mkdtemp, gettempdir
+
+
+class Scratch:
+    """Directory for the files of one check, kept in memory (tmpfs) when possible and removed on close"""
+    root = environ.get('JUDGE_SCRATCH', '/dev/shm' if path.isdir('/dev/shm') else gettempdir())
+    prefix = 'zhecker_'
+
+    def __init__(self):
+        self.path = mkdtemp(prefix=f'{Scratch.prefix}{getpid()}_', dir=Scratch.root)
+
+    def write(self, name: str, text: str) -> str:
+        """Save text to the file, return path to it"""
+        file = path.join(self.path, name)
+        with open(file, 'w', encoding='UTF-8') as scratch_file:
+            scratch_file.write(text)
+        return file
+
+    def close(self):
+        rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def clean_stale():
+        """Remove directories left by processes that are not running anymore"""
+        for name in listdir(Scratch.root):
+            if not name.startswith(Scratch.prefix):
+                continue
+            try:
+                kill(int(name[len(Scratch.prefix):].split('_')[0]), 0)
+            except ProcessLookupError:
+                rmtree(path.join(Scratch.root, name), ignore_errors=True)
+            except (ValueError, PermissionError):
+                pass
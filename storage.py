@@ -0,0 +1,72 @@
+import mmap
+from os import environ, path, makedirs, replace, remove, fstat, walk, getpid, utime
+from hashlib import sha256
+from contextlib import contextmanager
+from threading import get_ident
+from time import time
+
+
+class Storage:
+    """
+    Content-addressed files of test data, file is named by sha256 of its content and never changes,
+    so same input or output of different tests is kept once and tests refer to it by hash
+    """
+    root = path.abspath(environ.get('TEST_STORAGE', 'test_data'))  # folder with the files, absolute so changing working directory doesn't move it, tests/ holds tests of the code
+    encoding = 'UTF-8'
+
+    @staticmethod
+    def hash(text: str) -> str:
+        """Return hash the text is saved by"""
+        return sha256(text.encode(Storage.encoding)).hexdigest()
+
+    @staticmethod
+    def path(key: str) -> str:
+        """Return path to the file with hash key, files are spread over folders by the first two symbols"""
+        return path.join(Storage.root, key[:2], key[2:])
+
+    @staticmethod
+    def put(text: str) -> str:
+        """Save text if it is not saved yet, return its hash"""
+        key = Storage.hash(text)
+        file = Storage.path(key)
+        if not path.exists(file):
+            makedirs(path.dirname(file), exist_ok=True)
+            temporary = f'{file}.{getpid()}.{get_ident()}.tmp'
+            with open(temporary, 'wb') as blob:
+                blob.write(text.encode(Storage.encoding))
+            replace(temporary, file)  # readers see the whole file or nothing
+        else:
+            try:
+                utime(file)  # new again, Storage.clean() keeps it until the test that uses it is saved
+            except FileNotFoundError:
+                return Storage.put(text)  # removed by Storage.clean() right now
+        return key
+
+    @staticmethod
+    def read(key: str) -> str:
+        """Return text saved by hash"""
+        with open(Storage.path(key), 'rb') as blob:
+            return blob.read().decode(Storage.encoding)
+
+    @staticmethod
+    @contextmanager
+    def map(key: str):
+        """Memory-mapped read-only content saved by hash, pages are read by the system when they are used"""
+        with open(Storage.path(key), 'rb') as blob:
+            if fstat(blob.fileno()).st_size == 0:
+                yield b''  # empty file can't be mapped
+                return
+            with mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+
+    @staticmethod
+    def clean(used: set, age=3600) -> int:
+        """Remove files with hashes not in used that are older than age seconds (newer can belong to a test being added), return how many were removed"""
+        removed = 0
+        for folder, _, files in walk(Storage.root):
+            for name in files:
+                file = path.join(folder, name)
+                if path.basename(folder) + name not in used and path.getmtime(file) < time() - age:
+                    remove(file)
+                    removed += 1
+        return removed
@@ -1,15 +1,32 @@
 import subprocess
-from os import remove
-from time import time
+import signal
+from os import cpu_count, pipe, close
+from time import perf_counter
+from hashlib import sha256
+from json import dumps, loads
+from locale import getpreferredencoding
+from codecs import lookup
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import models
 from os import environ
-from random import randint
+from fork_server import ForkServer, Result, communicate, kill_group, wait as wait_process
+from comparator import Comparator, Collector
+from policy import Policy
+from scratch import Scratch
+from storage import Storage
 
 
 class Checker:
-    RESTRICTED = {'import', 'eval', 'exec', 'open'}  # functions that are not allowed in the code
-    time_to_start_process = 0.6  # some extra time before timeout
+    policy = Policy.from_environ()  # what is not allowed in the code
+    time_to_start_process = 0.6  # some extra time before timeout, used only without fork server
     python = environ['PYTHON_INTERPRETER']
+    parallel = environ.get('JUDGE_PARALLEL_TESTS', 'True') == 'True'  # run tests of one attempt at the same time
+    pool = ThreadPoolExecutor(max_workers=cpu_count() or 1, thread_name_prefix='tests')  # every test is a separate process
+    fork_server = ForkServer(python, cpu_count() or 1) if environ.get('JUDGE_FORK_SERVER', 'True') == 'True' and ForkServer.supported() else None
+    encoding = getpreferredencoding(False)  # encoding of stdin/stdout of solutions
+    mapped = lookup(encoding).name == lookup(Storage.encoding).name  # test files are given to solutions as they are, without decoding
+    output_limit = int(environ.get('JUDGE_OUTPUT_LIMIT', 16 * 1024 * 1024))  # bytes, reference output longer than that is OL
+    report_limit = int(environ.get('JUDGE_REPORT_LIMIT', 4096))  # bytes of wrong answer kept for the report
     errors = {
         'OK': 'successfully',
         'SB': 'solution banned',
@@ -17,82 +34,242 @@ class Checker:
         'CE': 'compilation error',
         'RE': 'run-time error',
         'TL': 'time limit',
+        'ML': 'memory limit',
+        'OL': 'output limit',
         'TS': 'test skipped',
+        'JE': 'judge error',
         '?': 'in progress'
     }
-    translator = str.maketrans('`~!@#$%^&*()_+{}:"<>?/.,\';][]=-', ' ' * 31)
+    compile_script = 'import py_compile, sys; py_compile.compile(sys.argv[1], cfile=sys.argv[2], doraise=True)'
 
     @staticmethod
     def get_output(task_id: int, inp: str) -> (str, str):
+        return Checker.get_outputs(task_id, [inp])[0]
+
+    @staticmethod
+    def get_outputs(task_id: int, inputs: list) -> list:
+        """Return [(status, output), ...] of the task reference for every input, inputs are run in parallel"""
         task = models.Task.get_task(task_id)
-        file = Checker.__save_file(task.reference)
-        try:
-            if Checker.__check_restricted(file):
-                Checker.__close_file(file)
-                return 'SB', ''
-            result = subprocess.run([Checker.python, file], input=inp, text=True, capture_output=True, timeout=task.time_limit + Checker.time_to_start_process, start_new_session=True)
-            Checker.__close_file(file)
-            if result.returncode == 0:
-                return 'OK', result.stdout
-            elif 'SyntaxError' in result.stderr:
-                return 'CE', ''
-            else:
-                return 'RE', ''
-        except subprocess.TimeoutExpired:
-            Checker.__close_file(file)
+        with Scratch() as scratch:
+            compiled = Checker.compile(scratch.write('reference.py', task.reference))
+            if compiled is None:
+                return [('CE', '')] * len(inputs)
+            if Checker.policy.is_banned(task.reference):
+                return [('SB', '')] * len(inputs)
+            return list(Checker.pool.map(lambda inp: Checker.__reference_output(compiled, inp, task.time_limit, task.memory_limit), inputs))
+
+    @staticmethod
+    def __reference_output(file: str, inp: str, time_limit: float, memory_limit) -> (str, str):
+        collector = Collector(Checker.output_limit)
+        result = Checker.run(file, inp, time_limit, collector, memory_limit)
+        if result.timeout:
             return 'TL', ''
+        elif Checker.__memory_exceeded(result, memory_limit):
+            return 'ML', ''
+        elif collector.stopped:
+            return 'OL', ''
+        elif result.returncode == 0:
+            return 'OK', collector.get_output(Checker.encoding)
+        else:
+            return 'RE', ''
+
+    @staticmethod
+    def compile(file: str):
+        """Byte-compile solution file once, return path to compiled file or None if there is a compilation error"""
+        target = file + 'c'
+        if Checker.fork_server is not None:
+            try:
+                return target if Checker.fork_server.compile(file, target) is None else None
+            except OSError:
+                pass  # worker died, compile the usual way
+        result = subprocess.run([Checker.python, '-c', Checker.compile_script, file, target], capture_output=True, start_new_session=True)
+        return target if result.returncode == 0 else None
+
+    @staticmethod
+    def run(file: str, inp, time_limit: float, output, memory_limit=None) -> Result:
+        """
+        Run solution file with inp (str or encoded bytes/mmap) as stdin, stdout is given to output (see comparator.py) chunk by chunk,
+        return Result (see fork_server.py) with returncode, timeout, time, cpu_time and peak memory,
+        memory_limit (MB) is how much more than an empty interpreter the solution can allocate, with fork server and without it
+        """
+        if Checker.fork_server is not None:
+            try:
+                return Checker.fork_server.run(file, inp, time_limit, output, memory_limit * 1024 * 1024 if memory_limit else None)
+            except OSError:
+                output.reset()  # worker died, run the usual way, part of the output can be taken already
+        stdin_r, stdin_w = pipe()
+        stdout_r, stdout_w = pipe()
+        stderr_r, stderr_w = pipe()
+        report_r, report_w = pipe()
+        request = {'file': file, 'memory_limit': memory_limit * 1024 * 1024 if memory_limit else None}
+        try:
+            process = subprocess.Popen([Checker.python, ForkServer.script, 'run', dumps(request), str(report_w)], stdin=stdin_r, stdout=stdout_w, stderr=stderr_w, pass_fds=[report_w], start_new_session=True)
+        finally:
+            for fd in (stdin_r, stdout_w, stderr_w, report_w):
+                close(fd)
+        start = perf_counter()
+        timeout = time_limit + Checker.time_to_start_process
+        errors, timed_out = communicate(inp.encode(Checker.encoding) if isinstance(inp, str) else inp, stdin_w, stdout_r, stderr_r, output, lambda: kill_group(process.pid), timeout)
+        status, usage, killed = wait_process(process.pid, max(timeout - (perf_counter() - start), 0))
+        with open(report_r, 'rb') as report:
+            run = loads(report.read() or b'null')  # nothing if the process was killed
+        result = Result.from_usage(status, usage, errors.decode(Checker.encoding, errors='replace'), timed_out or killed, perf_counter() - start)
+        process.returncode = result.returncode
+        if run is not None:
+            result.returncode, result.cpu_time, result.memory = run['returncode'], run['cpu_time'], run['memory']
+        else:
+            result.memory = None  # ru_maxrss of the killed process includes memory of the judge
+        return result
+
+    @staticmethod
+    def solution_hash(solution: str) -> str:
+        """Return hash of the solution, line endings and whitespace at the end of the file are ignored"""
+        return sha256(solution.replace('\r\n', '\n').rstrip().encode('UTF-8')).hexdigest()
 
     @staticmethod
-    def check_attempt(attempt_id: int):
+    def test_hash(test, task) -> str:
+        """Return hash of test content and limits of the task, trial of the attempt is current while it is the same"""
+        return sha256(f'{test.get_hash()} {task.time_limit} {task.memory_limit}'.encode('UTF-8')).hexdigest()
+
+    @staticmethod
+    def attempt_hash(solution_hash: str, task, tests: list) -> str:
+        """Return hash of everything the verdict depends on: solution (Attempt.solution_hash), tests (see Checker.test_hash) and their points"""
+        return sha256(dumps([solution_hash] + [(test.id, Checker.test_hash(test, task), test.points) for test in tests]).encode('UTF-8')).hexdigest()
+
+    @staticmethod
+    def check_attempt(attempt_id: int, job=None):
+        """
+        Check attempt and save its trials, trials of the attempt on the same test content are kept,
+        so when tests of the task are changed only new and changed tests are run and status/score are recomputed,
+        result of the job of judge_worker.py is not saved if other worker took it (see Attempt.save_result())
+        """
         attempt = models.Attempt.get_attempt(attempt_id)
-        file = Checker.__save_file(attempt.solution)
         task = models.Task.get_task(attempt.task_id)
-        status = 'OK'
+        tests = task.get_tests()
+        hashes = {test.id: Checker.test_hash(test, task) for test in tests}
+        current, stale = {}, []
+        for trial in attempt.get_tests_statuses():
+            if trial.status != 'TS' and trial.test_hash is not None and hashes.get(trial.test_id) == trial.test_hash and trial.test_id not in current:
+                current[trial.test_id] = trial
+            else:
+                stale.append(trial.id)
+        key = (task.id, Checker.solution_hash(attempt.solution), task.get_tests_hash(tests), task.time_limit)
+        if not current:
+            verdict = models.Verdict.get_verdict(*key)
+            if verdict is not None:
+                status, score, trials = verdict.status, verdict.score, verdict.get_trials()
+            else:
+                status, score, trials = Checker.__check_solution(attempt.solution, tests, task.time_limit, task.memory_limit, tests[0].id if tests else None)
+                if status != 'TL':  # time limit depends on the load of the server
+                    models.Verdict.add_verdict(*key, status=status, score=score, trials=trials)
+        else:
+            kept_failure = next((ind for ind, test in enumerate(tests) if test.id in current and current[test.id].status != 'OK'), len(tests))
+            missing = [test for test in tests[:kept_failure] if test.id not in current]  # tests after a failure are skipped anyway
+            trials = Checker.__check_solution(attempt.solution, missing, task.time_limit, task.memory_limit, tests[0].id)[2] if missing else []
+            statuses = {test_id: trial.status for test_id, trial in current.items()}
+            statuses.update({trial['test_id']: trial['status'] for trial in trials})
+            failed = next((ind for ind, test in enumerate(tests) if statuses[test.id] != 'OK'), len(tests))
+            run = {trial['test_id'] for trial in trials}
+            for test in tests[failed + 1:]:  # same as a full check: skipped after the first failure, even if they passed before
+                if test.id in current:
+                    stale.append(current.pop(test.id).id)
+                if test.id not in run:
+                    trials.append({'test_id': test.id, 'status': 'TS', 'output': None})
+            status = statuses[tests[failed].id] if failed < len(tests) else 'OK'
+            score = sum(test.points for test in tests[:failed])
+        attempt.save_result(status, score, [dict(trial, test_hash=hashes[trial['test_id']]) for trial in trials], Checker.attempt_hash(attempt.solution_hash, task, tests), stale, job)
+
+    @staticmethod
+    def __check_solution(solution: str, tests: list, time_limit: float, memory_limit, first_test_id) -> (str, int, list):
+        """
+        Run tests, the first test of the task (first_test_id) gets a second more for the start of the interpreter,
+        return status, score, [{'test_id': int, 'status': str, 'output': str or None, 'mismatch': int or None, 'time': float, 'cpu_time': float, 'memory': int}, ...]
+        """
+        with Scratch() as scratch:
+            compiled = Checker.compile(scratch.write('solution.py', solution))
+            banned = compiled is not None and Checker.policy.is_banned(solution)
+            if compiled is None or banned:
+                results = [('SB' if banned else 'CE', '', None, None)] + [None] * (len(tests) - 1) if tests else []
+            elif Checker.parallel and len(tests) > 1:
+                results = Checker.__run_parallel(compiled, tests, time_limit, memory_limit, first_test_id)
+            else:
+                results = Checker.__run_sequential(compiled, tests, time_limit, memory_limit, first_test_id)
+        status = 'CE' if compiled is None else 'SB' if banned else 'OK'
         score = 0
-        for ind, test in enumerate(task.get_tests()):
-            if status == 'OK':
-                status, output = Checker.__check_test(file, test.input, test.output, task.time_limit if ind != 0 else task.time_limit + 1)
-                models.Trial.add_trial(attempt_id=attempt_id, test_id=test.id, status=status, output=(output if output else None))
-                score = score + (test.points if status == 'OK' else 0)
+        trials = []
+        for test, result in zip(tests, results):
+            if result is None:
+                trials.append({'test_id': test.id, 'status': 'TS', 'output': None})
             else:
-                models.Trial.add_trial(attempt_id=attempt_id, test_id=test.id, status='TS')
-        attempt.change_data(status=status, score=score)
-        models.Task.get_task(task.id).add_attempt(status == 'OK')
-        Checker.__close_file(file)
+                status, output, mismatch, usage = result
+                trials.append({'test_id': test.id,
+                               'status': status,
+                               'output': output if output else None,
+                               'mismatch': mismatch,
+                               'time': usage.time if usage is not None else None,
+                               'cpu_time': usage.cpu_time if usage is not None else None,
+                               'memory': usage.memory if usage is not None else None})
+                score = score + (test.points if status == 'OK' else 0)
+        return status, score, trials
 
     @staticmethod
-    def __check_test(file: str, inp: str, out: str, tl: int) -> (str, str):
-        try:
-            if Checker.__check_restricted(file):
-                return 'SB', ''
-            result = subprocess.run([Checker.python, file], input=inp, text=True, capture_output=True, timeout=tl + Checker.time_to_start_process, start_new_session=True)
-            result.stderr = result.stderr.translate(Checker.translator)
-            if result.returncode == 0 and result.stdout == out:
-                return 'OK', ''
-            elif result.returncode == 0:
-                return 'WA', result.stdout
-            elif {'SyntaxError', 'IndentationError', 'TabError'} & set(result.stderr.replace('\n', ' ').split()):
-                return 'CE', ''
+    def __run_sequential(file: str, tests: list, time_limit: float, memory_limit, first_test_id) -> list:
+        """Return [(status, output, mismatch, Result) or None if test skipped, ...] running tests one by one until the first failure"""
+        results = []
+        for test in tests:
+            if results and (results[-1] is None or results[-1][0] != 'OK'):
+                results.append(None)
             else:
-                return 'RE', ''
-        except subprocess.TimeoutExpired:
-            return 'TL', ''
+                results.append(Checker.__check_test(file, test.input_hash, test.output_hash, time_limit if test.id != first_test_id else time_limit + 1, memory_limit))
+        return results
 
     @staticmethod
-    def __save_file(solution: str) -> str:
-        file_name = f"{int(time())}_{len(solution)}_{randint(0, 1000000)}.py"
-        file = open(file_name, 'w', encoding='UTF-8')
-        file.write(solution)
-        return file_name
+    def __run_parallel(file: str, tests: list, time_limit: float, memory_limit, first_test_id) -> list:
+        """Same as __run_sequential, but tests are run in Checker.pool, tests after the first failure are cancelled"""
+        futures = {Checker.pool.submit(Checker.__check_test, file, test.input_hash, test.output_hash, time_limit if test.id != first_test_id else time_limit + 1, memory_limit): ind for ind, test in enumerate(tests)}
+        results = [None] * len(tests)
+        failed = len(tests)  # index of the first failed test
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                ind = futures[future]
+                results[ind] = future.result()
+                if results[ind][0] != 'OK' and ind < failed:
+                    failed = ind
+            for future in list(pending):
+                if futures[future] > failed:
+                    future.cancel()
+                    pending.discard(future)
+        return [result if ind <= failed else None for ind, result in enumerate(results)]
 
     @staticmethod
-    def __close_file(file: str):
-        remove(file)
+    def __check_test(file: str, input_hash: str, output_hash: str, tl: int, memory_limit) -> (str, str, int, Result):
+        """
+        Run test with input and output from Storage, mapped files are fed to the solution and compared chunk by chunk,
+        on WA return first Checker.report_limit bytes of the output and the byte where it first differs from the expected one
+        """
+        if Checker.mapped:
+            with Storage.map(input_hash) as inp, Storage.map(output_hash) as out:
+                comparator = Comparator(out, Checker.encoding, Checker.report_limit)
+                result = Checker.run(file, inp, tl, comparator, memory_limit)
+        else:
+            comparator = Comparator(Storage.read(output_hash), Checker.encoding, Checker.report_limit)
+            result = Checker.run(file, Storage.read(input_hash), tl, comparator, memory_limit)
+        if result.timeout:
+            return 'TL', '', None, result
+        elif Checker.__memory_exceeded(result, memory_limit):
+            return 'ML', '', None, result
+        elif result.returncode == 0 and comparator.matched():
+            return 'OK', '', None, result
+        elif result.returncode == 0 or (comparator.stopped and result.returncode == -signal.SIGKILL):
+            return 'WA', comparator.get_report(Checker.encoding), comparator.mismatch, result
+        else:
+            return 'RE', '', None, result
 
     @staticmethod
-    def __check_restricted(file: str):
-        solution = open(file, 'r', encoding='UTF-8').read()
-        for bad_stuff in Checker.RESTRICTED:
-            if bad_stuff in solution:
-                return True
-        return False
+    def __memory_exceeded(result: Result, memory_limit) -> bool:
+        """memory_limit is in MB, peak memory of the result in KB"""
+        if not memory_limit:
+            return False
+        return (result.memory is not None and result.memory > memory_limit * 1024) or (result.returncode != 0 and 'MemoryError' in result.stderr)
@@ -0,0 +1,48 @@
+"""Shared fixtures: models bound to a temporary SQLite database, created once for the whole run"""
+import os
+import sys
+
+import pytest
+import sqlalchemy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('PYTHON_INTERPRETER', sys.executable)
+for key in ('HOST_FULLNAME', 'MAIL_LOGIN_GOOGLE', 'SALT'):
+    os.environ.setdefault(key, 'test')
+
+
+@pytest.fixture(scope='session')
+def models(tmp_path_factory):
+    """Module models with tables and indexes created in a fresh database, db_session.global_init() works once per process"""
+    directory = tmp_path_factory.mktemp('zhecker')
+    os.environ['TEST_STORAGE'] = str(directory / 'storage')
+    from db_session import global_init
+    global_init(str(directory / 'database.db'))
+    import models
+    models.__init__()
+    return models
+
+
+@pytest.fixture
+def engine(models):
+    from db_session import remove_session
+    engine = models.create_session().get_bind()
+    if engine.dialect.name != 'sqlite':
+        pytest.skip('query plans and counts are checked on SQLite')
+    yield engine
+    remove_session()  # as at the end of a request in main.py
+
+
+@pytest.fixture
+def statements(engine):
+    """Function that returns [(statement, parameters), ...] sent to the database while run() works"""
+    def record_statements(run) -> list:
+        statements = []
+        record = lambda connection, cursor, statement, parameters, context, executemany: statements.append((statement, parameters))
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', record)
+        try:
+            run()
+        finally:
+            sqlalchemy.event.remove(engine, 'before_cursor_execute', record)
+        return statements
+    return record_statements
@@ -0,0 +1,84 @@
+"""Contest views send the same number of SQL queries whatever the number of tasks and attempts, solutions included"""
+from itertools import count as counter
+from time import time
+
+import pytest
+from flask import Flask
+
+SOLUTION = 'a, b = map(int, input().split())\nprint(a + b)\n'
+numbers = counter()  # contests of all tests share the database
+
+
+@pytest.fixture
+def make_contest(models):
+    """Function that creates a contest with count tasks and attempts of its creator on each, returns (contest, user)"""
+    from db_session import create_session, remove_session
+
+    def make(count: int, attempts: int):
+        session = create_session()
+        name = f'counts {next(numbers)} {count} {attempts}'
+        user = models.User(username=name, email=name, password='', name='', surname='', register_date=int(time()), registered=True, creator=True, api_key=name)
+        session.add(user)
+        session.commit()
+        tasks = [models.Task(creator=user.id, time_limit=1.0, title=f'{name} {ind}', description='', reference=SOLUTION, attempts=0, successful=0) for ind in range(count)]
+        session.add_all(tasks)
+        session.commit()
+        contest = models.Contest(title=name, description='', start_time=int(time()) + 3600, end_time=int(time()) + 7200)
+        session.add(contest)
+        session.flush()
+        session.add(models.ContestCreator(contest_id=contest.id, user_id=user.id))
+        session.add_all([models.ContestTask(contest_id=contest.id, position=position, task_id=task.id) for position, task in enumerate(tasks)])
+        session.add_all([models.Attempt(contest_id=contest.id, task_id=task.id, user_id=user.id, solution=f'# {task.id} {ind}', status='OK', score=ind, time=int(time())) for task in tasks for ind in range(attempts)])
+        session.commit()
+        contest_id, user_id = contest.id, user.id
+        remove_session()
+        return models.Contest.get_contest(contest_id), models.User.get_user(user_id)
+    return make
+
+
+@pytest.fixture
+def request_queries(engine, statements):
+    """Function that returns number of SQL queries of one api request, the session is closed after it as in main.py"""
+    from db_session import remove_session
+    app = Flask(__name__)
+
+    def request(resource, *ids, api_key: str, show_solution=False) -> int:
+        def run():
+            with app.test_request_context('/', json={'api_key': api_key, 'show_solution': show_solution}):
+                resource().get(*ids)
+        remove_session()
+        try:
+            return len(statements(run))
+        finally:
+            remove_session()
+    return request
+
+
+def view_queries(contest, user, statements, solutions: bool) -> int:
+    view = {}
+    count = len(statements(lambda: view.update(contest.get_view(user.id, solutions=solutions))))
+    assert len(view['best']) == len(view['tasks'])
+    if solutions:
+        count += len(statements(lambda: [attempt.solution for attempt in list(view['best'].values()) + list(view['last'].values())]))
+    return count
+
+
+@pytest.mark.parametrize('count, attempts', [(1, 1), (5, 3)])
+def test_get_view(models, engine, statements, make_contest, count, attempts):
+    contest, user = make_contest(count, attempts)
+    assert view_queries(contest, user, statements, False) == 4
+    assert view_queries(contest, user, statements, True) == 5
+
+
+def test_resources_do_not_grow(models, engine, statements, make_contest, request_queries):
+    import resources
+    counts = []
+    for count, attempts in [(1, 2), (5, 3)]:  # some attempts are neither best nor last
+        contest, user = make_contest(count, attempts)
+        task_id = contest.get_task_ids()[0]
+        counts.append({show_solution: (request_queries(resources.ContestResource, contest.id, api_key=user.api_key, show_solution=show_solution),
+                                       request_queries(resources.ContestTaskResource, contest.id, task_id, api_key=user.api_key, show_solution=show_solution))
+                       for show_solution in (False, True)})
+    assert counts[0] == counts[1]
+    contest_queries, task_queries = counts[0][False]
+    assert counts[0][True] == (contest_queries + 1, task_queries + 2)  # sources of the best and last attempts, then of all attempts of the task
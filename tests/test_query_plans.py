@@ -0,0 +1,43 @@
+"""Frequent queries of models find rows by indexes instead of reading whole tables (EXPLAIN QUERY PLAN of SQLite)"""
+import re
+
+import pytest
+
+CHECKS = {
+    'Attempt.get_attempts': lambda models: models.Attempt.get_attempts(0, 0, 0, True),
+    'Attempt.get_best_result': lambda models: models.Attempt.get_best_result(0, 0, 0),
+    'Attempt.get_best_results': lambda models: models.Attempt.get_best_results(0, [1, 2], 0),
+    'Attempt.get_last_results': lambda models: models.Attempt.get_last_results(0, [1, 2], 0),
+    'Attempt.load_solutions': lambda models: models.Attempt.load_solutions([models.Attempt(solution_hash='')]),
+    'Trial.get_attempt_trials': lambda models: models.Trial.get_attempt_trials(0),
+    'Task.get_tests': lambda models: models.Task(id=0).get_tests(2),
+    'Contest.get_view': lambda models: models.Contest(id=0).get_view(0, solutions=True),
+    'Contest.get_rating': lambda models: models.Contest(id=0).get_rating(),
+    'Contest.get_task_contests': lambda models: models.Contest.get_task_contests(0),
+    'Contest.get_user_contests': lambda models: models.Contest.get_user_contests(0),
+    'User.get_api': lambda models: models.User.get_api(''),
+    'User.email_verification': lambda models: models.create_session().query(models.User).filter(models.User.email == '', models.User.verification == '').first(),
+    'Verdict.get_verdict': lambda models: models.Verdict.get_verdict(0, '', '', 1.0),
+}
+
+
+def query_plans(engine, statements: list) -> list:
+    """Return lines of EXPLAIN QUERY PLAN of the statements"""
+    with engine.connect() as connection:
+        return [row[-1] for statement, parameters in statements for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+
+
+def scans(plans: list, tables: set) -> list:
+    """Return lines of the plans that read a whole table, aliases such as attempts_1 are counted as their table"""
+    return [plan for plan in plans if plan.split()[0] == 'SCAN' and re.sub(r'_\d+$', '', plan.replace('TABLE ', '').split()[1]) in tables]
+
+
+def test_alias_is_counted_as_table():
+    assert scans(['SCAN attempts_1', 'SCAN TABLE trial', 'SCAN anon_1', 'SEARCH attempts USING INDEX ix_attempts_contest_task_user (contest_id=?)'], {'attempts', 'trial'}) == ['SCAN attempts_1', 'SCAN TABLE trial']
+
+
+@pytest.mark.parametrize('name', list(CHECKS))
+def test_query_uses_indexes(models, engine, statements, name):
+    plans = query_plans(engine, statements(lambda: CHECKS[name](models)))
+    print(name, *plans, sep='\n    ')
+    assert not scans(plans, set(models.SqlAlchemyBase.metadata.tables)), '\n'.join(plans)
@@ -0,0 +1,85 @@
+"""Standings stay right when checks of one user are saved at the same time"""
+from itertools import count as counter
+from threading import Thread
+from time import time
+
+import sqlalchemy
+
+numbers = counter()  # users and contests of all tests share the database
+
+
+def make_attempts(models, tasks: int) -> list:
+    """Create a running contest with tasks, return ids of unchecked attempts of one user, one on every task"""
+    from db_session import create_session, remove_session
+    session = create_session()
+    name = f'standings {next(numbers)}'
+    user = models.User(username=name, email=name, password='', name='', surname='', register_date=int(time()), registered=True, creator=True)
+    session.add(user)
+    session.commit()
+    task_list = [models.Task(creator=user.id, time_limit=1.0, title=f'{name} {ind}', description='', reference='print(1)\n', attempts=0, successful=0) for ind in range(tasks)]
+    session.add_all(task_list)
+    contest = models.Contest(title=name, description='', start_time=0, end_time=int(time()) + 3600)
+    session.add(contest)
+    session.flush()
+    session.add_all([models.ContestTask(contest_id=contest.id, position=position, task_id=task.id) for position, task in enumerate(task_list)])
+    attempts = [models.Attempt(contest_id=contest.id, task_id=task.id, user_id=user.id, solution=f'# {name} {task.id}', status='?', time=int(time())) for task in task_list]
+    session.add_all(attempts)
+    session.commit()
+    ids = [attempt.id for attempt in attempts]
+    remove_session()
+    return ids
+
+
+def standings(models, attempt_id: int) -> dict:
+    """Return {task_id: score} of the attempt's user in its contest"""
+    from db_session import create_session, remove_session
+    session = create_session()
+    attempt = session.query(models.Attempt).filter(models.Attempt.id == attempt_id).first()
+    rows = {standing.task_id: standing.score for standing in session.query(models.Standing).filter(models.Standing.contest_id == attempt.contest_id, models.Standing.user_id == attempt.user_id)}
+    remove_session()
+    return rows
+
+
+def save(models, attempt_id: int, score: int, errors: list):
+    from db_session import remove_session
+    try:
+        assert models.Attempt.get_attempt(attempt_id).save_result('OK', score, [])
+    except Exception as ex:
+        errors.append(ex)
+    finally:
+        remove_session()
+
+
+def test_parallel_checks(models, engine):
+    ids = make_attempts(models, 2)
+    errors = []
+    threads = [Thread(target=save, args=(models, attempt_id, score, errors)) for attempt_id, score in zip(ids, (3, 4))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert [models.Attempt.get_attempt(attempt_id).status for attempt_id in ids] == ['OK', 'OK']
+    assert standings(models, ids[0])[models.Standing.TOTAL] == 7
+
+
+def test_row_inserted_by_other_check(models, engine):
+    ids = make_attempts(models, 1)
+    attempt = models.Attempt.get_attempt(ids[0])
+    key = (attempt.contest_id, attempt.user_id, attempt.task_id)
+    inserted = []
+
+    def insert_after_read(connection, cursor, statement, parameters, context, executemany):
+        if not inserted and statement.lstrip().startswith('SELECT') and 'FROM standings' in statement:  # row is not there when it is read
+            inserted.append(True)
+            cursor.connection.execute('INSERT INTO standings (contest_id, user_id, task_id, score) VALUES (?, ?, ?, ?)', key + (1,))
+
+    sqlalchemy.event.listen(engine, 'after_cursor_execute', insert_after_read)
+    try:
+        errors = []
+        save(models, ids[0], 5, errors)
+    finally:
+        sqlalchemy.event.remove(engine, 'after_cursor_execute', insert_after_read)
+    assert inserted and errors == []
+    assert models.Attempt.get_attempt(ids[0]).status == 'OK'
+    assert standings(models, ids[0]) == {key[2]: 5, models.Standing.TOTAL: 5}